@@ -0,0 +1,221 @@
+import gzip
+import importlib.util
+import json
+import multiprocessing
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import httpx
+from dotenv import load_dotenv
+from postgrest.exceptions import APIError
+from supabase import create_client, Client, ClientOptions
+
+# orjson is optional - fall back to the standard library parser when it isn't installed
+try:
+    import orjson
+    json_loads = orjson.loads
+    
+    def json_dumps_indented(obj):
+        """Serialize to indented UTF-8 JSON bytes"""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY, default=str)
+except ImportError:
+    orjson = None
+    json_loads = json.loads
+    
+    def json_dumps_indented(obj):
+        """Serialize to indented UTF-8 JSON bytes"""
+        return json.dumps(obj, indent=2, default=str).encode()
+
+# pyarrow is optional - when installed, whole-file CSV reads use its multi-threaded parser,
+# which also types numeric and boolean columns while parsing
+if importlib.util.find_spec('pyarrow'):
+    CSV_READ_OPTIONS = {'engine': 'pyarrow'}
+else:
+    CSV_READ_OPTIONS = {'low_memory': False}
+
+# Load environment variables once for every importer
+load_dotenv()
+
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_KEY = os.getenv('SUPABASE_KEY')
+
+# Number of uploads in flight at once - the shared connection pool is sized to match
+CONCURRENCY = int(os.getenv('IMPORT_CONCURRENCY', '8'))
+
+# Opt-in gzip for upload bodies (IMPORT_GZIP_BODIES=1) - wide JSON batches compress several-fold,
+# but only enable it when the API gateway in front of PostgREST accepts Content-Encoding: gzip
+GZIP_BODIES = os.getenv('IMPORT_GZIP_BODIES') == '1'
+GZIP_MIN_BYTES = 1024
+
+class GzipRequestTransport(httpx.HTTPTransport):
+    """HTTP transport that gzips request bodies above GZIP_MIN_BYTES"""
+
+    def handle_request(self, request):
+        if request.method in ('POST', 'PATCH', 'PUT') and 'content-encoding' not in request.headers:
+            body = request.read()
+            if len(body) >= GZIP_MIN_BYTES:
+                # Level 1 - most of the size reduction for very little CPU
+                headers = request.headers.copy()
+                del headers['content-length']
+                headers['content-encoding'] = 'gzip'
+                request = httpx.Request(request.method, request.url, headers=headers,
+                                        content=gzip.compress(body, compresslevel=1),
+                                        extensions=request.extensions)
+        return super().handle_request(request)
+
+class OrjsonClient(httpx.Client):
+    """httpx client that encodes json= request bodies with orjson instead of the json module"""
+
+    def build_request(self, method, url, *, content=None, json=None, headers=None, **kwargs):
+        if json is not None and content is None:
+            # orjson writes compact UTF-8 bytes directly - same body httpx would send
+            content = orjson.dumps(json, option=orjson.OPT_SERIALIZE_NUMPY)
+            headers = httpx.Headers(headers)
+            headers['content-type'] = 'application/json'
+        return super().build_request(method, url, content=content, headers=headers, **kwargs)
+
+@lru_cache(maxsize=1)
+def get_client() -> Client:
+    """Create the Supabase client on first use and reuse it for the rest of the process"""
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in .env file")
+
+    # One keep-alive pool for all requests; HTTP/2 multiplexes concurrent uploads
+    transport = (GzipRequestTransport if GZIP_BODIES else httpx.HTTPTransport)(
+        http2=True,
+        limits=httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY),
+    )
+    http_client = (OrjsonClient if orjson else httpx.Client)(transport=transport, timeout=60.0)
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=http_client))
+
+def list_csv_files(folder):
+    """Sorted paths of the CSV files in a folder - one directory scan, no pattern matching"""
+    # Like sorted(glob.glob(f'{folder}/*.csv')) a missing folder gives no files and dotfiles are
+    # skipped; is_file() uses the type cached by the scan, so no per-file stat
+    try:
+        with os.scandir(folder) as entries:
+            return sorted(entry.path for entry in entries
+                          if entry.name.endswith('.csv') and not entry.name.startswith('.') and entry.is_file())
+    except FileNotFoundError:
+        return []
+
+# Worker processes that parse and clean CSVs ahead of the upload
+PREP_WORKERS = int(os.getenv('IMPORT_PREP_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+def map_in_workers(func, items):
+    """Yield func(item) for each item, in order, computed ahead in forked worker processes"""
+    # Workers are forked so they don't re-run the importer's top-level prompts; where fork
+    # isn't available (or IMPORT_PREP_WORKERS is 1) items are processed inline.
+    # At most PREP_WORKERS items are submitted ahead of the consumer, so a slow upload
+    # holds back the workers instead of letting finished results pile up in memory
+    if PREP_WORKERS > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        with multiprocessing.get_context('fork').Pool(PREP_WORKERS) as pool:
+            pending = deque()
+            for item in items:
+                if len(pending) >= PREP_WORKERS:
+                    yield pending.popleft().get()
+                pending.append(pool.apply_async(func, (item,)))
+            while pending:
+                yield pending.popleft().get()
+    else:
+        yield from map(func, items)
+
+# Upload requests are split so each JSON body stays under the API gateway's request size limit
+MAX_BODY_BYTES = int(os.getenv('IMPORT_MAX_BODY_BYTES', str(4 * 1024 * 1024)))
+
+def iter_batches(records, max_bytes, max_rows=None):
+    """Yield batches of records whose JSON body fits in max_bytes, and at most max_rows records"""
+    batch, batch_bytes = [], 2  # the enclosing brackets
+    for record in records:
+        record_bytes = len(json.dumps(record, default=str)) + 2  # plus the ', ' separator
+        if batch and ((max_rows and len(batch) >= max_rows) or batch_bytes + record_bytes > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 2
+        batch.append(record)
+        batch_bytes += record_bytes
+    if batch:
+        yield batch
+
+# Transient failures (network errors, rate limits, gateway errors) are retried with backoff
+RETRY_ATTEMPTS = 5
+TRANSIENT_STATUS_CODES = {'429', '500', '502', '503', '504'}
+
+def is_transient(error):
+    """True for errors worth retrying as-is rather than bisecting the batch"""
+    if isinstance(error, httpx.TransportError):
+        return True
+    return isinstance(error, APIError) and str(error.code) in TRANSIENT_STATUS_CODES
+
+def execute_with_backoff(query):
+    """Execute a query, retrying transient errors with exponential backoff and full jitter"""
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            return query.execute()
+        except Exception as e:
+            if attempt == RETRY_ATTEMPTS - 1 or not is_transient(e):
+                raise
+            time.sleep(random.uniform(0, min(30, 0.1 * 2 ** attempt)))
+
+class RateLimiter:
+    """Thread-safe token bucket - acquire() blocks until another request may be sent"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Each caller reserves a token under the lock, then sleeps outside it; a negative
+        # balance queues callers in arrival order, each 1/rate seconds after the last
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+# Batch size tuning - IMPORT_BATCH_SIZE=auto times a sample upload at each candidate size
+TUNE_BATCH_SIZES = [100, 250, 500, 1000, 2000]
+TUNE_SAMPLE_ROWS = 10000
+
+def batch_size_from_env(default):
+    """IMPORT_BATCH_SIZE as an int, or None when set to 'auto' so the importer tunes it"""
+    value = os.getenv('IMPORT_BATCH_SIZE', default)
+    return None if value == 'auto' else int(value)
+
+def tune_batch_size(insert_batch, sample, executor):
+    """Upload equal slices of sample at each candidate size. Returns (fastest size, batches, results)"""
+    slice_rows = len(sample) // len(TUNE_BATCH_SIZES)
+    seconds_per_row = {}
+    batches = []
+    results = []
+    for i, size in enumerate(TUNE_BATCH_SIZES):
+        # The last slice takes the remainder so every sample record is uploaded exactly once
+        end = len(sample) if i == len(TUNE_BATCH_SIZES) - 1 else (i + 1) * slice_rows
+        part = sample[i * slice_rows:end]
+        part_batches = [part[j:j + size] for j in range(0, len(part), size)]
+        
+        start = time.perf_counter()
+        results.extend(executor.map(insert_batch, part_batches))
+        seconds_per_row[size] = (time.perf_counter() - start) / len(part)
+        batches.extend(part_batches)
+    
+    return min(seconds_per_row, key=seconds_per_row.get), batches, results
+
+def season_counts(table, seasons):
+    """Count a table's rows per season, one concurrent head-only query each. Returns [(season, count)]"""
+    def count(season):
+        result = get_client().table(table).select('season', count='exact', head=True).eq('season', season).execute()
+        return season, result.count
+    
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        return list(executor.map(count, seasons))
@@ -1,19 +1,8 @@
 import pandas as pd
-from supabase import create_client, Client
-from dotenv import load_dotenv
-import os
-
-# Load environment variables
-load_dotenv()
+from common import SUPABASE_URL, get_client
 
 # Initialize Supabase client
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in .env file")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase = get_client()
 
 print("🏀 Starting Conferences Import...")
 print(f"📊 Connected to Supabase: {SUPABASE_URL}")
@@ -52,11 +41,11 @@ if df['id'].duplicated().any():
 print("\n🔧 Cleaning data types...")
 df['id'] = df['id'].astype(int)
 
-# Replace NaN with None
-df = df.where(pd.notna(df), None)
-
-# Convert to list of dicts
-records = df.to_dict('records')
+# Convert to list of dicts, replacing NaN/NA with None in the same pass (NaN != NaN)
+records = [
+    {k: (None if v is pd.NA or v != v else v) for k, v in row.items()}
+    for row in df.to_dict('records')
+]
 print(f"\n📦 Prepared {len(records)} conferences for import")
 
 # Since this is a small dataset, import all at once
@@ -95,7 +84,7 @@ try:
     print(f"✅ Database now contains {db_count} conferences")
     
     # Show a sample
-    sample = supabase.table('conferences').select('*').limit(5).execute()
+    sample = supabase.table('conferences').select('id, abbreviation, name').limit(5).execute()
     print("\n📋 Sample of imported conferences:")
     for conf in sample.data:
         print(f"   {conf['id']:2d}. {conf['abbreviation']:10s} - {conf['name']}")
@@ -1,25 +1,63 @@
 import pandas as pd
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import numpy as np
+from common import (SUPABASE_URL, CONCURRENCY, TUNE_SAMPLE_ROWS, get_client, execute_with_backoff,
+                    is_transient, json_loads, json_dumps_indented, batch_size_from_env, tune_batch_size)
 import os
-import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from datetime import datetime
 
-# Load environment variables
-load_dotenv()
-
 # Initialize Supabase client
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in .env file")
+supabase = get_client()
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Upload tuning - batches are sent concurrently since the import is network-bound.
+# None means IMPORT_BATCH_SIZE=auto: tuned on the first records of the upload
+BATCH_SIZE = batch_size_from_env('1000')
 
 print("🏀 Starting Statguy.ai Games Import v2...")
 print(f"📊 Connected to Supabase: {SUPABASE_URL}")
 
+def insert_batch(batch):
+    """Insert a batch, bisecting on failure to isolate bad rows. Returns (inserted, failures, batch_failed)"""
+    try:
+        execute_with_backoff(supabase.table('games').insert(batch))
+        return len(batch), [], False
+    except Exception as e:
+        # Still failing after backoff, or a single bad row - record the failures
+        if is_transient(e) or len(batch) == 1:
+            return 0, [{'record': record, 'error': str(e)} for record in batch], True
+        
+        # Retry each half - only halves that still fail are split further
+        mid = len(batch) // 2
+        left_inserted, left_failures, _ = insert_batch(batch[:mid])
+        right_inserted, right_failures, _ = insert_batch(batch[mid:])
+        return left_inserted + right_inserted, left_failures + right_failures, True
+
+# Optional direct Postgres connection - when set, bulk loads use COPY instead of REST inserts
+SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL')
+db_conn = None
+if SUPABASE_DB_URL:
+    import psycopg
+    from psycopg import sql
+    from psycopg.types.json import Jsonb
+    db_conn = psycopg.connect(SUPABASE_DB_URL, autocommit=True)
+    print("📊 Bulk loading with COPY over a direct Postgres connection")
+
+def copy_records(records):
+    """Bulk load records with a single COPY in one transaction"""
+    columns = list(records[0].keys())
+    query = sql.SQL("COPY games ({}) FROM STDIN").format(
+        sql.SQL(', ').join(map(sql.Identifier, columns))
+    )
+    with db_conn.transaction(), db_conn.cursor() as cur:
+        with cur.copy(query) as copy:
+            for record in records:
+                # period_points lists are stored as JSON
+                copy.write_row(tuple(
+                    Jsonb(value) if isinstance(value, (list, dict)) else value
+                    for value in record.values()
+                ))
+
 # Option to clear existing data
 print("\n❓ Clear existing data in games table first?")
 print("1. Yes - delete all existing games")
@@ -39,12 +77,14 @@ print("\n📂 Reading games.csv...")
 df = pd.read_csv('games.csv')
 print(f"✅ Loaded {len(df)} games from CSV")
 
-# Better duplicate detection
+# Better duplicate detection - one np.unique pass gives the counts and keep-first positions
 print("\n🔍 Checking for duplicate IDs in CSV...")
-duplicate_count = df['id'].duplicated().sum()
+ids = df['id'].to_numpy()
+unique_ids, first_idx, id_counts = np.unique(ids, return_index=True, return_counts=True)
+duplicate_count = len(ids) - len(unique_ids)
 if duplicate_count > 0:
     print(f"⚠️  WARNING: Found {duplicate_count} duplicate IDs in CSV")
-    duplicate_ids = df[df['id'].duplicated(keep=False)]['id'].unique()
+    duplicate_ids = unique_ids[id_counts > 1]
     print(f"   Unique IDs that appear multiple times: {len(duplicate_ids)}")
     print(f"   First 10 duplicate IDs: {duplicate_ids[:10].tolist()}")
     
@@ -55,10 +95,12 @@ if duplicate_count > 0:
     dup_choice = input("Enter choice (1, 2, or 3): ").strip()
     
     if dup_choice == "1":
-        df = df.drop_duplicates(subset=['id'], keep='first')
+        df = df.iloc[np.sort(first_idx)]
         print(f"✅ Kept first occurrence, removed {duplicate_count} duplicates")
     elif dup_choice == "2":
-        df = df.drop_duplicates(subset=['id'], keep='last')
+        # Last occurrence = first occurrence in the reversed array
+        _, last_idx = np.unique(ids[::-1], return_index=True)
+        df = df.iloc[np.sort(len(ids) - 1 - last_idx)]
         print(f"✅ Kept last occurrence, removed {duplicate_count} duplicates")
     else:
         print("❌ Import aborted")
@@ -85,9 +127,9 @@ print("🏀 Converting period points to JSON...")
 for prefix in ['home', 'away']:
     col_name = f'{prefix}_period_points'
     if col_name in df.columns:
-        df[col_name] = df[col_name].apply(
-            lambda x: json.loads(x) if pd.notna(x) and isinstance(x, str) else None
-        )
+        # Only parse the JSON strings - NaN and already-parsed values become None
+        is_json = df[col_name].map(type).eq(str)
+        df[col_name] = df.loc[is_json, col_name].map(json_loads).reindex(df.index)
 
 # Handle boolean columns
 print("✅ Converting boolean columns...")
@@ -100,60 +142,76 @@ for col in boolean_cols:
 if 'start_date' in df.columns:
     df['start_date'] = pd.to_datetime(df['start_date']).dt.strftime('%Y-%m-%d')
 
-# Replace NaN with None
-df = df.where(pd.notna(df), None)
-
-# Convert to list of dicts
-records = df.to_dict('records')
+# Convert to list of dicts, replacing NaN/NA with None in the same pass (NaN != NaN).
+# Rows are zipped from object column arrays rather than built by to_dict('records')
+columns = df.columns.tolist()
+records = [
+    {k: (None if v is pd.NA or v != v else v) for k, v in zip(columns, row)}
+    for row in zip(*(df[col].astype(object).to_numpy() for col in columns))
+]
 print(f"\n📦 Prepared {len(records)} records for import")
 
 # Setup failure tracking
 failed_records = []
 failure_log_file = f"import_failures_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
 
-# Batch insert with individual retry
-print("\n⬆️  Uploading to Supabase...")
-batch_size = 1000
 total_inserted = 0
 failed_batches = 0
+copied = False
 
-for i in range(0, len(records), batch_size):
-    batch = records[i:i + batch_size]
-    batch_num = (i // batch_size) + 1
-    total_batches = (len(records) + batch_size - 1) // batch_size
-    
+# COPY everything in one transaction when a direct connection is available
+if db_conn and records:
+    print("\n⬆️  Copying to Postgres...")
     try:
-        result = supabase.table('games').insert(batch).execute()
-        total_inserted += len(batch)
-        print(f"   ✅ Batch {batch_num}/{total_batches}: Inserted {len(batch)} records")
+        copy_records(records)
+        total_inserted = len(records)
+        copied = True
+        print(f"   ✅ Copied {len(records)} records")
     except Exception as e:
-        # Batch failed - retry individual records
-        print(f"   ⚠️  Batch {batch_num}/{total_batches} failed, retrying individually...")
-        failed_batches += 1
-        batch_success = 0
-        batch_failures = 0
+        print(f"   ⚠️  COPY failed, falling back to batch inserts: {str(e)[:80]}")
+
+# Batch insert with bisection retry, CONCURRENCY requests in flight at a time
+if not copied:
+    print("\n⬆️  Uploading to Supabase...")
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        # Time a sample at each candidate batch size, then use the fastest for the rest
+        upload = records
+        probe_batches, probe_results = [], []
+        if BATCH_SIZE is None and len(records) >= TUNE_SAMPLE_ROWS:
+            BATCH_SIZE, probe_batches, probe_results = tune_batch_size(
+                insert_batch, records[:TUNE_SAMPLE_ROWS], executor)
+            upload = records[TUNE_SAMPLE_ROWS:]
+            print(f"   🎯 Tuned batch size: {BATCH_SIZE}")
+        batch_size = BATCH_SIZE or 1000
         
-        for record in batch:
-            try:
-                supabase.table('games').insert([record]).execute()
-                batch_success += 1
-                total_inserted += 1
-            except Exception as record_error:
-                batch_failures += 1
-                failed_records.append({
-                    'record': record,
-                    'error': str(record_error)
-                })
+        upload_batches = [upload[i:i + batch_size] for i in range(0, len(upload), batch_size)]
+        batches = probe_batches + upload_batches
+        total_batches = len(batches)
         
-        print(f"      ✅ Successfully inserted {batch_success}/{len(batch)} records")
-        if batch_failures > 0:
-            print(f"      ❌ Failed to insert {batch_failures}/{len(batch)} records")
+        for batch_num, (batch, (inserted, failures, batch_failed)) in enumerate(
+                zip(batches, chain(probe_results, executor.map(insert_batch, upload_batches))), 1):
+            total_inserted += inserted
+            if not batch_failed:
+                print(f"   ✅ Batch {batch_num}/{total_batches}: Inserted {inserted} records")
+                continue
+            
+            # Batch failed - halves were retried until the bad records were isolated
+            print(f"   ⚠️  Batch {batch_num}/{total_batches} failed, retried by bisection...")
+            failed_batches += 1
+            failed_records.extend(failures)
+            
+            print(f"      ✅ Successfully inserted {inserted}/{len(batch)} records")
+            if failures:
+                print(f"      ❌ Failed to insert {len(failures)}/{len(batch)} records")
+
+if db_conn:
+    db_conn.close()
 
 # Save failed records to file
 if failed_records:
     print(f"\n💾 Saving {len(failed_records)} failed records to {failure_log_file}...")
-    with open(failure_log_file, 'w') as f:
-        json.dump(failed_records, f, indent=2, default=str)
+    with open(failure_log_file, 'wb') as f:
+        f.write(json_dumps_indented(failed_records))
     print(f"✅ Failed records saved to: {failure_log_file}")
 
 # Summary
@@ -163,7 +221,7 @@ print("="*50)
 print(f"Total records in CSV: {len(records)}")
 print(f"Successfully inserted: {total_inserted}")
 print(f"Failed records: {len(failed_records)}")
-print(f"Batches that needed individual retry: {failed_batches}")
+print(f"Batches that needed bisection retry: {failed_batches}")
 
 if len(failed_records) > 0:
     print(f"\n⚠️  {len(failed_records)} records failed to import")
@@ -1,87 +1,90 @@
-import pandas as pd
-from supabase import create_client, Client
-from dotenv import load_dotenv
+from common import (SUPABASE_URL, CONCURRENCY, TUNE_SAMPLE_ROWS, get_client, execute_with_backoff,
+                    is_transient, batch_size_from_env, tune_batch_size, season_counts,
+                    map_in_workers, list_csv_files)
+from player_game_stats_prep import chunk_records, prep_year
 import os
-import glob
-import math
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from datetime import datetime
 
-# Load environment variables
-load_dotenv()
-
 # Initialize Supabase client
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in .env file")
+supabase = get_client()
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Upload tuning - batches are sent concurrently since the import is network-bound.
+# None means IMPORT_BATCH_SIZE=auto: tuned on the first year with enough records
+BATCH_SIZE = batch_size_from_env('500')
 
 print("🏀 Starting Player Game Stats Import...")
 print(f"📊 Connected to Supabase: {SUPABASE_URL}")
 
-# Column mapping: CSV -> Database snake_case
-# Note: Most columns are already snake_case, but some need mapping
-COLUMN_MAPPING = {
-    'game_id': 'game_id',
-    'season': 'season',
-    'season_type': 'season_type',
-    'start_date': 'start_date',
-    'team_id': 'team_id',
-    'team': 'team',
-    # conference - will be dropped
-    'team_seed': 'team_seed',
-    'opponent_id': 'opponent_id',
-    'opponent': 'opponent',
-    # opponent_conference - will be dropped
-    'opponent_seed': 'opponent_seed',
-    'neutral_site': 'neutral_site',
-    'is_home': 'is_home',
-    'conference_game': 'conference_game',
-    'game_type': 'game_type',
-    'game_minutes': 'game_minutes',
-    'game_pace': 'game_pace',
-    'name': 'name',
-    'position': 'position',
-    'athleteId': 'athlete_id',  # Note: camelCase in CSV
-    'starter': 'starter',
-    'ejected': 'ejected',
-    'minutes': 'minutes',
-    'points': 'points',
-    'assists': 'assists',
-    'turnovers': 'turnovers',
-    'fouls': 'fouls',
-    'steals': 'steals',
-    'blocks': 'blocks',
-    'rebounds_total': 'rebounds_total',
-    'rebounds_defensive': 'rebounds_defensive',
-    'rebounds_offensive': 'rebounds_offensive',
-    # Shooting stats with mixed case in CSV
-    'fieldGoals_pct': 'field_goals_pct',
-    'fieldGoals_attempted': 'field_goals_attempted',
-    'fieldGoals_made': 'field_goals_made',
-    'twoPointFieldGoals_pct': 'two_point_field_goals_pct',
-    'twoPointFieldGoals_attempted': 'two_point_field_goals_attempted',
-    'twoPointFieldGoals_made': 'two_point_field_goals_made',
-    'threePointFieldGoals_pct': 'three_point_field_goals_pct',
-    'threePointFieldGoals_attempted': 'three_point_field_goals_attempted',
-    'threePointFieldGoals_made': 'three_point_field_goals_made',
-    'freeThrows_pct': 'free_throws_pct',
-    'freeThrows_attempted': 'free_throws_attempted',
-    'freeThrows_made': 'free_throws_made',
-    # Advanced metrics
-    'usage': 'usage',
-    'offensiveRating': 'offensive_rating',
-    'defensiveRating': 'defensive_rating',
-    'netRating': 'net_rating',
-    'effectiveFieldGoalPct': 'effective_field_goal_pct',
-    'trueShootingPct': 'true_shooting_pct',
-    'gameScore': 'game_score',
-    'assistsTurnoverRatio': 'assists_turnover_ratio',
-    'freeThrowRate': 'free_throw_rate',
-    'offensiveReboundPct': 'offensive_rebound_pct',
-}
+# Optional positional-row inserts through a stored function - column names are sent once per
+# batch instead of once per row. Create the function once in the Supabase SQL editor:
+#
+#   create or replace function bulk_insert_player_game_stats(batch_columns text[], batch_rows jsonb)
+#   returns integer language plpgsql as $$
+#   declare inserted integer;
+#   begin
+#     execute format(
+#       'insert into player_game_stats (%1$s) select %1$s from jsonb_populate_recordset(null::player_game_stats,
+#          (select jsonb_agg((select jsonb_object_agg($1[i], row_values -> (i - 1))
+#                             from generate_subscripts($1, 1) as i))
+#           from jsonb_array_elements($2) as row_values))',
+#       (select string_agg(quote_ident(col), ', ') from unnest(batch_columns) as col)
+#     ) using batch_columns, batch_rows;
+#     get diagnostics inserted = row_count;
+#     return inserted;
+#   end;
+#   $$;
+USE_BULK_RPC = os.getenv('IMPORT_USE_BULK_RPC') == '1'
+if USE_BULK_RPC:
+    print("📊 Inserting positional rows through bulk_insert_player_game_stats()")
+
+def insert_query(batch):
+    """Build the insert request for a batch - positional rows via RPC, or keyed records via REST"""
+    if USE_BULK_RPC:
+        # Every record in a year shares the same key order, so the first one names the columns
+        return supabase.rpc('bulk_insert_player_game_stats', {
+            'batch_columns': list(batch[0].keys()),
+            'batch_rows': [list(record.values()) for record in batch],
+        })
+    return supabase.table('player_game_stats').insert(batch)
+
+def insert_batch(batch):
+    """Insert a batch, bisecting on failure to isolate bad rows. Returns (inserted, failures)"""
+    try:
+        execute_with_backoff(insert_query(batch))
+        return len(batch), []
+    except Exception as e:
+        # Still failing after backoff, or a single bad row - record the failures
+        if is_transient(e) or len(batch) == 1:
+            return 0, [(record, e) for record in batch]
+        
+        # Retry each half - only halves that still fail are split further
+        mid = len(batch) // 2
+        left_inserted, left_failures = insert_batch(batch[:mid])
+        right_inserted, right_failures = insert_batch(batch[mid:])
+        return left_inserted + right_inserted, left_failures + right_failures
+
+# Optional direct Postgres connection - when set, bulk loads use COPY instead of REST inserts
+SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL')
+db_conn = None
+if SUPABASE_DB_URL:
+    import psycopg
+    from psycopg import sql
+    db_conn = psycopg.connect(SUPABASE_DB_URL, autocommit=True)
+    print("📊 Bulk loading with COPY over a direct Postgres connection")
+
+def copy_records(records):
+    """Bulk load records with a single COPY in one transaction"""
+    columns = list(records[0].keys())
+    query = sql.SQL("COPY player_game_stats ({}) FROM STDIN").format(
+        sql.SQL(', ').join(map(sql.Identifier, columns))
+    )
+    with db_conn.transaction(), db_conn.cursor() as cur:
+        with cur.copy(query) as copy:
+            for record in records:
+                copy.write_row(tuple(record.values()))
 
 # Option to clear existing data
 print("\n❓ Clear existing data in player_game_stats table first?")
@@ -98,7 +101,7 @@ if clear_choice == "1":
 
 # Find all CSV files in player_game_stats folder
 csv_folder = 'player_game_stats'
-csv_files = sorted(glob.glob(f'{csv_folder}/*.csv'))
+csv_files = list_csv_files(csv_folder)
 
 if not csv_files:
     print(f"\n❌ No CSV files found in {csv_folder}/ folder!")
@@ -115,133 +118,95 @@ total_inserted = 0
 failed_files = []
 file_summary = []
 
-# Process each CSV file
-for csv_file in csv_files:
-    filename = os.path.basename(csv_file)
-    year = filename.replace('.csv', '')
-    
-    print(f"\n{'='*60}")
-    print(f"📅 Processing {year}...")
-    print(f"{'='*60}")
-    
-    try:
-        # Read CSV
-        df = pd.read_csv(csv_file, low_memory=False)
-        print(f"   ✅ Loaded {len(df)} player-game records from {filename}")
-        
-        # Rename columns to snake_case
-        rename_dict = {k: v for k, v in COLUMN_MAPPING.items() if k in df.columns}
-        df = df.rename(columns=rename_dict)
-        
-        # Drop conference columns (data quality issues)
-        conference_columns = ['conference', 'opponent_conference']
-        df = df.drop(columns=[col for col in conference_columns if col in df.columns], errors='ignore')
-        
-        # Remove duplicates - keep first instance of each (game_id, athlete_id)
-        initial_count = len(df)
-        df = df.drop_duplicates(subset=['game_id', 'athlete_id'], keep='first')
-        duplicates_removed = initial_count - len(df)
-        if duplicates_removed > 0:
-            print(f"   🔧 Removed {duplicates_removed} duplicate rows")
-        
-        # Define integer vs decimal columns
-        integer_columns = [
-            'game_id', 'athlete_id', 'season', 'team_id', 'opponent_id',
-            'team_seed', 'opponent_seed', 'game_minutes', 'game_pace',
-            'minutes', 'points', 'assists', 'turnovers', 'fouls', 'steals', 'blocks',
-            'field_goals_attempted', 'field_goals_made',
-            'two_point_field_goals_attempted', 'two_point_field_goals_made',
-            'three_point_field_goals_attempted', 'three_point_field_goals_made',
-            'free_throws_attempted', 'free_throws_made',
-            'rebounds_total', 'rebounds_defensive', 'rebounds_offensive',
-        ]
-        
-        boolean_columns = ['neutral_site', 'is_home', 'conference_game', 'starter', 'ejected']
+# Parse and clean years in worker processes while this process uploads the previous year.
+# Results arrive in year order, and the upload side stays single-process to share one connection pool
+with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+    for prepared in map_in_workers(prep_year, csv_files):
+        filename = prepared['filename']
+        year = prepared['year']
         
-        # Clean data types
-        for col in df.columns:
-            if col in ['name', 'team', 'opponent', 'season_type', 'game_type', 'position', 'start_date']:
-                continue  # Skip string/date columns
-            elif col in boolean_columns:
-                # Boolean columns
-                df[col] = df[col].fillna(False).astype(bool)
-            elif col in integer_columns:
-                # Integer columns - more robust conversion
-                try:
-                    # First convert to numeric, then round, then to Int64
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                    # Round to handle any floating point precision issues
-                    df[col] = df[col].round(0)
-                    # Convert to nullable integer
-                    df[col] = df[col].astype('Int64')
-                except Exception as e:
-                    print(f"      Warning: Could not convert {col} to integer: {e}")
-                    # Leave as float if conversion fails
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-            else:
-                # Decimal columns (ratings, percentages, etc.)
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+        print(f"\n{'='*60}")
+        print(f"📅 Processing {year}...")
+        print(f"{'='*60}")
         
-        # Handle date column
-        if 'start_date' in df.columns:
-            df['start_date'] = pd.to_datetime(df['start_date'], errors='coerce').dt.strftime('%Y-%m-%d')
+        if prepared['error']:
+            print(f"   ❌ Error processing {filename}: {prepared['error']}")
+            failed_files.append({'file': filename, 'error': prepared['error']})
+            continue
         
-        # Replace NaN with None - CRITICAL for Supabase
-        df = df.replace({float('nan'): None, float('inf'): None, float('-inf'): None})
-        
-        # Convert to records
-        records = df.to_dict('records')
-        
-        # Double-check: Replace any remaining NaN values
-        for record in records:
-            for key, value in record.items():
-                if value is not None and isinstance(value, float):
-                    if math.isnan(value) or math.isinf(value):
-                        record[key] = None
-        
-        total_records += len(records)
-        
-        # Import in batches
-        batch_size = 500
-        file_inserted = 0
-        file_failed = 0
-        
-        for i in range(0, len(records), batch_size):
-            batch = records[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            total_batches = (len(records) + batch_size - 1) // batch_size
+        try:
+            file_records = 0
+            file_inserted = 0
+            file_failed = 0
+            batch_num = 0
             
-            try:
-                supabase.table('player_game_stats').insert(batch).execute()
-                file_inserted += len(batch)
-                total_inserted += len(batch)
-                print(f"   ✅ Batch {batch_num}/{total_batches}: Inserted {len(batch)} records")
-            except Exception as e:
-                print(f"   ⚠️  Batch {batch_num} failed, retrying individually...")
+            print(f"   ✅ Loaded {prepared['rows']} player-game records from {filename}")
+            if prepared['duplicates_removed'] > 0:
+                print(f"   🔧 Removed {prepared['duplicates_removed']} duplicate rows")
+            
+            # Records are built and loaded one CSV chunk at a time, so only one chunk's
+            # records are held alongside the year's cleaned DataFrames
+            for chunk in prepared['chunks']:
+                records = chunk_records(chunk)
+                file_records += len(records)
+                total_records += len(records)
                 
-                for record in batch:
+                # COPY the whole chunk when a direct connection is available
+                if db_conn and records:
                     try:
-                        supabase.table('player_game_stats').insert([record]).execute()
-                        file_inserted += 1
-                        total_inserted += 1
-                    except Exception as record_error:
-                        file_failed += 1
+                        copy_records(records)
+                        file_inserted += len(records)
+                        total_inserted += len(records)
+                        print(f"   ✅ Copied {len(records)} records")
+                        continue
+                    except Exception as e:
+                        print(f"   ⚠️  COPY failed, falling back to batch inserts: {str(e)[:80]}")
+                
+                # Time a sample at each candidate batch size once, then use the fastest for the rest
+                upload = records
+                probe_results = []
+                if BATCH_SIZE is None and len(upload) >= TUNE_SAMPLE_ROWS:
+                    BATCH_SIZE, _, probe_results = tune_batch_size(insert_batch, upload[:TUNE_SAMPLE_ROWS], executor)
+                    upload = upload[TUNE_SAMPLE_ROWS:]
+                    print(f"   🎯 Tuned batch size: {BATCH_SIZE}")
+                batch_size = BATCH_SIZE or 500
+                
+                # Import in batches, CONCURRENCY requests in flight at a time
+                batches = [upload[i:i + batch_size] for i in range(0, len(upload), batch_size)]
+                for inserted, failures in chain(probe_results, executor.map(insert_batch, batches)):
+                    batch_num += 1
+                    file_inserted += inserted
+                    total_inserted += inserted
+                    if not failures:
+                        # Overwrite one progress line instead of printing a line per batch
+                        sys.stdout.write(f"\r   ✅ Batch {batch_num}: {file_inserted:,} records inserted")
+                        sys.stdout.flush()
+                        continue
+                    
+                    # Failures go out in a single write that ends the progress line
+                    file_failed += len(failures)
+                    lines = [f"\n   ⚠️  Batch {batch_num} failed, retried by bisection..."]
+                    for record, record_error in failures:
                         player_info = f"Game {record.get('game_id', '?')}, {record.get('name', 'Unknown')}"
                         error_msg = str(record_error)[:80]
-                        print(f"      ❌ {player_info}: {error_msg}")
-        
-        file_summary.append({
-            'year': year,
-            'total': len(records),
-            'inserted': file_inserted,
-            'failed': file_failed
-        })
-        
-        print(f"   📊 {year} Summary: {file_inserted} inserted, {file_failed} failed")
-        
-    except Exception as e:
-        print(f"   ❌ Error processing {filename}: {e}")
-        failed_files.append({'file': filename, 'error': str(e)})
+                        lines.append(f"      ❌ {player_info}: {error_msg}")
+                    sys.stdout.write('\n'.join(lines) + '\n')
+            
+            if batch_num:
+                sys.stdout.write('\n')
+            
+            file_summary.append({
+                'year': year,
+                'total': file_records,
+                'inserted': file_inserted,
+                'failed': file_failed
+            })
+            
+            print(f"   📊 {year} Summary: {file_inserted} inserted, {file_failed} failed")
+            
+        except Exception as e:
+            print(f"   ❌ Error processing {filename}: {e}")
+            failed_files.append({'file': filename, 'error': str(e)})
 
 # Final Summary
 print("\n" + "="*60)
@@ -271,13 +236,27 @@ try:
     
     # Show season breakdown (sample)
     print("\n📊 Sample records by season:")
-    for year in range(2005, 2010):
-        count_result = supabase.table('player_game_stats').select('season', count='exact').eq('season', year).execute()
-        if count_result.count > 0:
-            print(f"   {year}: {count_result.count:,} records")
+    if db_conn:
+        # One GROUP BY scan instead of a count query per season
+        with db_conn.cursor() as cur:
+            cur.execute(
+                "SELECT season, COUNT(*) FROM player_game_stats "
+                "WHERE season BETWEEN %s AND %s GROUP BY season ORDER BY season",
+                (2005, 2009),
+            )
+            counts = cur.fetchall()
+    else:
+        # Without a direct connection, send the per-season counts concurrently
+        counts = season_counts('player_game_stats', range(2005, 2010))
+    for year, count in counts:
+        if count > 0:
+            print(f"   {year}: {count:,} records")
     print("   ...")
     
 except Exception as e:
     print(f"❌ Verification failed: {e}")
 
+if db_conn:
+    db_conn.close()
+
 print("\n✨ Import complete!")
\ No newline at end of file
@@ -1,33 +1,45 @@
 import pandas as pd
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import numpy as np
+from common import (SUPABASE_URL, CONCURRENCY, get_client, season_counts, map_in_workers, list_csv_files,
+                    execute_with_backoff, is_transient)
 import os
-import glob
-import math
+from concurrent.futures import ThreadPoolExecutor
+from postgrest.types import ReturnMethod
 from datetime import datetime
 
-# Load environment variables
-load_dotenv()
-
-# Initialize Supabase client
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in .env file")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Initialize Supabase client - shared HTTP/2 keep-alive pool for every batch and file
+supabase = get_client()
 
 print("🏀 Starting Player Season Stats Import...")
 print(f"📊 Connected to Supabase: {SUPABASE_URL}")
 
+# return=minimal - the inserted rows are never used, so don't have PostgREST send them back
+def insert_batch(batch):
+    """Insert a batch with backoff, falling back to one-by-one inserts on a non-transient failure.
+    Returns (inserted, failures, batch_failed)"""
+    try:
+        execute_with_backoff(supabase.table('player_season_stats').insert(batch, returning=ReturnMethod.minimal))
+        return len(batch), [], False
+    except Exception as e:
+        # Still failing after backoff - one request per row would only add to the load
+        if is_transient(e):
+            return 0, [(record, e) for record in batch], True
+        
+        failures = []
+        for record in batch:
+            try:
+                execute_with_backoff(supabase.table('player_season_stats').insert([record], returning=ReturnMethod.minimal))
+            except Exception as record_error:
+                failures.append((record, record_error))
+        return len(batch) - len(failures), failures, True
+
 # Column mapping: CSV camelCase -> Database snake_case
 COLUMN_MAPPING = {
     'season': 'season',
     'seasonLabel': 'season_label',
     'teamId': 'team_id',
     'team': 'team',
-    # conference - will be dropped
+    # conference - not loaded (data quality issues)
     'athleteId': 'athlete_id',
     'name': 'name',
     'position': 'position',
@@ -71,6 +83,98 @@ COLUMN_MAPPING = {
     'winShares_offensive': 'win_shares_offensive',
 }
 
+STRING_COLUMNS = frozenset({'name', 'team', 'season_label', 'position'})
+
+# Define integer vs decimal columns - sets so membership checks are hash lookups
+INTEGER_COLUMNS = frozenset({
+    'season', 'athlete_id', 'team_id', 'games', 'starts', 'minutes',
+    'points', 'turnovers', 'fouls', 'assists', 'steals', 'blocks',
+    'field_goals_attempted', 'field_goals_made',
+    'two_point_field_goals_attempted', 'two_point_field_goals_made',
+    'three_point_field_goals_attempted', 'three_point_field_goals_made',
+    'free_throws_attempted', 'free_throws_made',
+    'rebounds_total', 'rebounds_defensive', 'rebounds_offensive',
+})
+
+def clean_frame(df):
+    """Rename columns and clean data types for a year's CSV rows"""
+    # Rename columns to snake_case
+    rename_dict = {k: v for k, v in COLUMN_MAPPING.items() if k in df.columns}
+    df = df.rename(columns=rename_dict)
+    
+    # Clean data types - one vectorized conversion per type family
+    int_cols = [col for col in df.columns if col in INTEGER_COLUMNS]
+    decimal_cols = [col for col in df.columns if col not in INTEGER_COLUMNS and col not in STRING_COLUMNS]
+    
+    # Integer columns - round to handle float precision, drop inf so the Int64 cast can't fail
+    ints = np.rint(df[int_cols].apply(pd.to_numeric, errors='coerce'))
+    df[int_cols] = ints.where(np.isfinite(ints)).astype('Int64')
+    
+    # Decimal columns (ratings, percentages, etc.) - inf becomes NaN, then None - CRITICAL for Supabase
+    decimals = df[decimal_cols].apply(pd.to_numeric, errors='coerce')
+    df[decimal_cols] = decimals.where(np.isfinite(decimals))
+    
+    return df
+
+def prepare_records(csv_file):
+    """Read, clean and dedup one year's CSV into insert records (runs in a worker process)"""
+    filename = os.path.basename(csv_file)
+    result = {
+        'year': filename.replace('.csv', ''),
+        'filename': filename,
+        'rows': 0,
+        'duplicates_removed': 0,
+        'records': [],
+        'error': None,
+    }
+    
+    try:
+        # Read CSV - only mapped columns are parsed, and string columns skip type inference.
+        # A season file is one row per player, so the whole year is read in one go
+        df = pd.read_csv(
+            csv_file,
+            usecols=lambda col: col in COLUMN_MAPPING,
+            dtype={col: str for col, db_col in COLUMN_MAPPING.items() if db_col in STRING_COLUMNS},
+            low_memory=False,
+        )
+        result['rows'] = len(df)
+        df = clean_frame(df)
+        
+        # Remove duplicates - keep first instance of each (season, athlete_id)
+        duplicated = df.duplicated(subset=['season', 'athlete_id'], keep='first')
+        result['duplicates_removed'] = int(duplicated.sum())
+        df = df[~duplicated]
+        
+        # Convert to records - the object cast turns every NaN/NA into None in one pass
+        df = df.astype(object).where(df.notna(), None)
+        columns = df.columns.tolist()
+        result['records'] = [dict(zip(columns, row)) for row in zip(*(df[col].to_numpy() for col in columns))]
+    except Exception as e:
+        result['error'] = str(e)
+    
+    return result
+
+def report_batches(batches, results):
+    """Print the outcome of each uploaded batch. Returns (inserted, failed)"""
+    inserted_count = 0
+    failed_count = 0
+    for batch_num, (batch, (inserted, failures, batch_failed)) in enumerate(zip(batches, results), 1):
+        inserted_count += inserted
+        if not batch_failed:
+            print(f"   ✅ Batch {batch_num}: Inserted {len(batch)} records")
+            continue
+        
+        if failures and is_transient(failures[0][1]):
+            print(f"   ⚠️  Batch {batch_num} failed after retrying with backoff...")
+        else:
+            print(f"   ⚠️  Batch {batch_num} failed, retried individually...")
+        for record, record_error in failures:
+            failed_count += 1
+            player_info = f"{record.get('name', 'Unknown')} ({record.get('team', '?')})"
+            error_msg = str(record_error)[:80]
+            print(f"      ❌ {player_info}: {error_msg}")
+    return inserted_count, failed_count
+
 # Option to clear existing data
 print("\n❓ Clear existing data in player_season_stats table first?")
 print("1. Yes - delete all existing stats")
@@ -86,7 +190,7 @@ if clear_choice == "1":
 
 # Find all CSV files in player_season_stats folder
 csv_folder = 'player_season_stats'
-csv_files = sorted(glob.glob(f'{csv_folder}/*.csv'))
+csv_files = list_csv_files(csv_folder)
 
 if not csv_files:
     print(f"\n❌ No CSV files found in {csv_folder}/ folder!")
@@ -103,113 +207,48 @@ total_inserted = 0
 failed_files = []
 file_summary = []
 
-# Process each CSV file
-for csv_file in csv_files:
-    filename = os.path.basename(csv_file)
-    year = filename.replace('.csv', '')
-    
-    print(f"\n{'='*60}")
-    print(f"📅 Processing {year}...")
-    print(f"{'='*60}")
-    
-    try:
-        # Read CSV
-        df = pd.read_csv(csv_file, low_memory=False)
-        print(f"   ✅ Loaded {len(df)} player records from {filename}")
-        
-        # Rename columns to snake_case
-        rename_dict = {k: v for k, v in COLUMN_MAPPING.items() if k in df.columns}
-        df = df.rename(columns=rename_dict)
-        
-        # Drop conference column (data quality issues)
-        if 'conference' in df.columns:
-            df = df.drop(columns=['conference'])
-        
-        # Remove duplicates - keep first instance of each (season, athlete_id)
-        initial_count = len(df)
-        df = df.drop_duplicates(subset=['season', 'athlete_id'], keep='first')
-        duplicates_removed = initial_count - len(df)
-        if duplicates_removed > 0:
-            print(f"   🔧 Removed {duplicates_removed} duplicate rows")
-        
-        # Define integer vs decimal columns
-        integer_columns = [
-            'season', 'athlete_id', 'team_id', 'games', 'starts', 'minutes',
-            'points', 'turnovers', 'fouls', 'assists', 'steals', 'blocks',
-            'field_goals_attempted', 'field_goals_made',
-            'two_point_field_goals_attempted', 'two_point_field_goals_made',
-            'three_point_field_goals_attempted', 'three_point_field_goals_made',
-            'free_throws_attempted', 'free_throws_made',
-            'rebounds_total', 'rebounds_defensive', 'rebounds_offensive',
-        ]
-        
-        # Clean data types
-        for col in df.columns:
-            if col in ['name', 'team', 'season_label', 'position']:
-                continue  # Skip string columns
-            elif col in integer_columns:
-                # Integer columns
-                df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
-            else:
-                # Decimal columns (ratings, percentages, etc.)
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+# Process each CSV file - years are parsed and cleaned in worker processes while this
+# process uploads the previous year; results arrive in year order
+with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+    for prepared in map_in_workers(prepare_records, csv_files):
+        filename = prepared['filename']
+        year = prepared['year']
         
-        # Replace NaN with None - CRITICAL for Supabase
-        df = df.replace({float('nan'): None, float('inf'): None, float('-inf'): None})
+        print(f"\n{'='*60}")
+        print(f"📅 Processing {year}...")
+        print(f"{'='*60}")
         
-        # Convert to records
-        records = df.to_dict('records')
+        if prepared['error']:
+            print(f"   ❌ Error processing {filename}: {prepared['error']}")
+            failed_files.append({'file': filename, 'error': prepared['error']})
+            continue
         
-        # Double-check: Replace any remaining NaN values
-        for record in records:
-            for key, value in record.items():
-                if value is not None and isinstance(value, float):
-                    if math.isnan(value) or math.isinf(value):
-                        record[key] = None
-        
-        total_records += len(records)
-        
-        # Import in batches
-        batch_size = 500
-        file_inserted = 0
-        file_failed = 0
-        
-        for i in range(0, len(records), batch_size):
-            batch = records[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            total_batches = (len(records) + batch_size - 1) // batch_size
+        try:
+            records = prepared['records']
+            print(f"   ✅ Loaded {prepared['rows']} player records from {filename}")
+            if prepared['duplicates_removed'] > 0:
+                print(f"   🔧 Removed {prepared['duplicates_removed']} duplicate rows")
             
-            try:
-                supabase.table('player_season_stats').insert(batch).execute()
-                file_inserted += len(batch)
-                total_inserted += len(batch)
-                print(f"   ✅ Batch {batch_num}/{total_batches}: Inserted {len(batch)} records")
-            except Exception as e:
-                print(f"   ⚠️  Batch {batch_num} failed, retrying individually...")
-                
-                for record in batch:
-                    try:
-                        supabase.table('player_season_stats').insert([record]).execute()
-                        file_inserted += 1
-                        total_inserted += 1
-                    except Exception as record_error:
-                        file_failed += 1
-                        player_info = f"{record.get('name', 'Unknown')} ({record.get('team', '?')})"
-                        error_msg = str(record_error)[:80]
-                        print(f"      ❌ {player_info}: {error_msg}")
-        
-        file_summary.append({
-            'year': year,
-            'total': len(records),
-            'inserted': file_inserted,
-            'failed': file_failed
-        })
-        
-        print(f"   📊 {year} Summary: {file_inserted} inserted, {file_failed} failed")
-        
-    except Exception as e:
-        print(f"   ❌ Error processing {filename}: {e}")
-        failed_files.append({'file': filename, 'error': str(e)})
+            total_records += len(records)
+            
+            # Batches go out concurrently, CONCURRENCY requests in flight at a time
+            batch_size = 500
+            batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+            file_inserted, file_failed = report_batches(batches, executor.map(insert_batch, batches))
+            total_inserted += file_inserted
+            
+            file_summary.append({
+                'year': year,
+                'total': len(records),
+                'inserted': file_inserted,
+                'failed': file_failed
+            })
+            
+            print(f"   📊 {year} Summary: {file_inserted} inserted, {file_failed} failed")
+            
+        except Exception as e:
+            print(f"   ❌ Error processing {filename}: {e}")
+            failed_files.append({'file': filename, 'error': str(e)})
 
 # Final Summary
 print("\n" + "="*60)
@@ -237,12 +276,11 @@ try:
     db_count = result.count
     print(f"✅ Database now contains {db_count:,} player-season records")
     
-    # Show season breakdown (sample)
+    # Show season breakdown (sample) - counts are fetched concurrently
     print("\n📊 Sample records by season:")
-    for year in range(2005, 2010):
-        count_result = supabase.table('player_season_stats').select('season', count='exact').eq('season', year).execute()
-        if count_result.count > 0:
-            print(f"   {year}: {count_result.count:,} players")
+    for year, count in season_counts('player_season_stats', range(2005, 2010)):
+        if count > 0:
+            print(f"   {year}: {count:,} players")
     print("   ...")
     
 except Exception as e:
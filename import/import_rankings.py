@@ -1,29 +1,57 @@
 import os
 import requests
-from dotenv import load_dotenv
-from supabase import create_client, Client
+import pandas as pd
 from datetime import datetime, timezone
+from common import SUPABASE_URL, get_client, json_loads
 
-# Load environment variables
-load_dotenv()
-
-# Configuration
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
+# Configuration - common loads .env and get_client() checks the Supabase settings
 CBBD_API_BASE = os.getenv('CBBD_API_BASE', 'https://api.collegebasketballdata.com')
 CBBD_API_KEY = os.getenv('CBDB_API_KEY')
 
 # Validate environment variables
-if not all([SUPABASE_URL, SUPABASE_KEY, CBBD_API_KEY]):
-    raise ValueError("Missing required environment variables")
+if not CBBD_API_KEY:
+    raise ValueError("CBBD_API_KEY not found in environment variables")
 
 print(f"✓ Loaded SUPABASE_URL: {SUPABASE_URL}")
 print(f"✓ Loaded CBBD_API_KEY: {CBBD_API_KEY[:10]}...")
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Initialize Supabase client - the shared one from common, reused by every importer in the process
+supabase = get_client()
 print("✓ Supabase client connected")
 
+# Optional direct Postgres connection - when set, rankings are upserted with COPY instead of REST
+SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL')
+db_conn = None
+if SUPABASE_DB_URL:
+    import psycopg
+    from psycopg import sql
+    db_conn = psycopg.connect(SUPABASE_DB_URL, autocommit=True)
+    print("✓ Bulk loading with COPY over a direct Postgres connection")
+
+RANKINGS_KEY_COLUMNS = ['season', 'season_type', 'week', 'poll_type', 'team_id']
+
+def copy_upsert_rankings(records):
+    """COPY records into a temp table, then upsert them into rankings in one transaction"""
+    columns = list(records[0].keys())
+    column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+    updates = sql.SQL(', ').join(
+        sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(col))
+        for col in columns if col not in RANKINGS_KEY_COLUMNS
+    )
+    with db_conn.transaction(), db_conn.cursor() as cur:
+        cur.execute("CREATE TEMP TABLE rankings_staging (LIKE rankings INCLUDING DEFAULTS) ON COMMIT DROP")
+        with cur.copy(sql.SQL("COPY rankings_staging ({}) FROM STDIN").format(column_list)) as copy:
+            for record in records:
+                copy.write_row(tuple(record.values()))
+        cur.execute(sql.SQL(
+            "INSERT INTO rankings ({cols}) SELECT {cols} FROM rankings_staging "
+            "ON CONFLICT ({keys}) DO UPDATE SET {updates}"
+        ).format(
+            cols=column_list,
+            keys=sql.SQL(', ').join(map(sql.Identifier, RANKINGS_KEY_COLUMNS)),
+            updates=updates,
+        ))
+
 # API Headers
 HEADERS = {
     'accept': 'application/json',
@@ -44,7 +72,8 @@ def import_all_rankings():
         print("  → Making API request (this may take 10-30 seconds)...")
         response = requests.get(url, headers=HEADERS, timeout=60)
         response.raise_for_status()
-        rankings_data = response.json()
+        # Parse the raw bytes with orjson when it's installed - much faster on the large array
+        rankings_data = json_loads(response.content)
         
         if not rankings_data:
             print("⚠️  No rankings data available")
@@ -58,21 +87,13 @@ def import_all_rankings():
     
     # Analyze the data
     print("\n[2/4] Analyzing data...")
-    seasons = set()
-    poll_types = set()
-    teams = set()
-    records_with_poll_date = 0
-    
-    for record in rankings_data:
-        seasons.add(record.get('season'))
-        poll_types.add(record.get('pollType'))
-        teams.add(record.get('teamId'))
-        if record.get('pollDate'):
-            records_with_poll_date += 1
-    
-    print(f"  → Seasons covered: {min(seasons)} to {max(seasons)}")
-    print(f"  → Poll types: {', '.join(sorted(poll_types))}")
-    print(f"  → Unique teams: {len(teams)}")
+    # Only the analyzed fields go into the DataFrame - aggregates are computed column-wise
+    analysis_df = pd.DataFrame.from_records(rankings_data, columns=['season', 'pollType', 'teamId', 'pollDate'])
+    records_with_poll_date = int((analysis_df['pollDate'].notna() & analysis_df['pollDate'].astype(bool)).sum())
+    
+    print(f"  → Seasons covered: {analysis_df['season'].min()} to {analysis_df['season'].max()}")
+    print(f"  → Poll types: {', '.join(sorted(analysis_df['pollType'].dropna().unique()))}")
+    print(f"  → Unique teams: {analysis_df['teamId'].nunique()}")
     print(f"  → Records with poll_date: {records_with_poll_date:,} ({records_with_poll_date/len(rankings_data)*100:.1f}%)")
     
     # Process rankings and DEDUPLICATE
@@ -83,6 +104,18 @@ def import_all_rankings():
     errors = []
     duplicates_found = 0
     
+    # One timestamp for the whole import instead of two clock reads per record
+    now_iso = datetime.now(timezone.utc).isoformat()
+    
+    # Poll dates are sliced in the loop below - check the format once so drift can't go unnoticed
+    sample_poll_date = next((r['pollDate'] for r in rankings_data if r.get('pollDate')), None)
+    if sample_poll_date:
+        try:
+            datetime.fromisoformat(sample_poll_date.replace('Z', '+00:00'))
+        except ValueError:
+            print(f"✗ Unexpected pollDate format from API: {sample_poll_date!r}")
+            return
+    
     for rank_data in rankings_data:
         try:
             # Create composite key
@@ -94,17 +127,9 @@ def import_all_rankings():
                 rank_data['teamId']
             )
             
-            # Parse the poll date (nullable)
-            poll_date = None
-            if rank_data.get('pollDate'):
-                try:
-                    # Parse ISO format: "2024-10-14T00:00:00.000Z"
-                    poll_date = datetime.fromisoformat(
-                        rank_data['pollDate'].replace('Z', '+00:00')
-                    ).date().isoformat()
-                except Exception as e:
-                    # If date parsing fails, leave as None
-                    pass
+            # Poll date (nullable) - the API always sends ISO format "2024-10-14T00:00:00.000Z",
+            # so the date is the first 10 characters
+            poll_date = rank_data['pollDate'][:10] if rank_data.get('pollDate') else None
             
             ranking_record = {
                 'season': rank_data['season'],
@@ -118,8 +143,8 @@ def import_all_rankings():
                 'ranking': rank_data.get('ranking'),  # nullable (others receiving votes)
                 'points': rank_data.get('points', 0),
                 'first_place_votes': rank_data.get('firstPlaceVotes', 0),
-                'created_at': datetime.now(timezone.utc).isoformat(),
-                'updated_at': datetime.now(timezone.utc).isoformat()
+                'created_at': now_iso,
+                'updated_at': now_iso
             }
             
             # Check for duplicates
@@ -150,8 +175,19 @@ def import_all_rankings():
     print(f"\n[4/4] Inserting rankings into database...")
     rankings_inserted = 0
     chunk_size = 1000
+    copied = False
+    
+    # Upsert everything in one COPY when a direct connection is available
+    if db_conn and rankings_to_insert:
+        try:
+            copy_upsert_rankings(rankings_to_insert)
+            rankings_inserted = len(rankings_to_insert)
+            copied = True
+            print(f"  → Copied {rankings_inserted:,} records")
+        except Exception as e:
+            print(f"  ⚠️  COPY failed, falling back to batch upserts: {str(e)[:80]}")
     
-    if rankings_to_insert:
+    if rankings_to_insert and not copied:
         print(f"  → Inserting in batches of {chunk_size}...")
         
         for i in range(0, len(rankings_to_insert), chunk_size):
@@ -159,7 +195,7 @@ def import_all_rankings():
             try:
                 supabase.table('rankings').upsert(
                     chunk,
-                    on_conflict='season,season_type,week,poll_type,team_id'
+                    on_conflict=','.join(RANKINGS_KEY_COLUMNS)
                 ).execute()
                 rankings_inserted += len(chunk)
                 
@@ -189,4 +225,6 @@ def import_all_rankings():
             print(f"  ... and {len(errors) - 10} more errors")
 
 if __name__ == "__main__":
-    import_all_rankings()
\ No newline at end of file
+    import_all_rankings()
+    if db_conn:
+        db_conn.close()
\ No newline at end of file
@@ -1,32 +1,25 @@
 import os
 import requests
-from dotenv import load_dotenv
-from supabase import create_client, Client
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from common import SUPABASE_URL, get_client
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
-# Load environment variables
-load_dotenv()
-
-# Configuration
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
+# Configuration - common loads .env and get_client() checks the Supabase settings
 CBBD_API_BASE = os.getenv('CBBD_API_BASE', 'https://api.collegebasketballdata.com')
 CBBD_API_KEY = os.getenv('CBDB_API_KEY')
 
 # Validate environment variables
-if not SUPABASE_URL:
-    raise ValueError("SUPABASE_URL not found in environment variables")
-if not SUPABASE_KEY:
-    raise ValueError("SUPABASE_KEY not found in environment variables")
 if not CBBD_API_KEY:
     raise ValueError("CBBD_API_KEY not found in environment variables")
 
 print(f"✓ Loaded SUPABASE_URL: {SUPABASE_URL}")
 print(f"✓ Loaded CBBD_API_KEY: {CBBD_API_KEY[:10]}...")
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Initialize Supabase client - the shared one from common, which encodes upload bodies with orjson
+supabase = get_client()
 print("✓ Supabase client connected")
 
 # API Headers with authentication
@@ -35,26 +28,85 @@ HEADERS = {
     'Authorization': f'Bearer {CBBD_API_KEY}'
 }
 
+# One keep-alive session for every API call - later seasons reuse the TCP/TLS connection,
+# and gateway errors are retried with backoff
+session = requests.Session()
+session.headers.update(HEADERS)
+session.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=10,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+))
+
 def get_all_teams():
     """Fetch all teams from your database"""
     response = supabase.table('teams').select('id, source_id').execute()
     return response.data
 
-def import_roster_for_season(season):
-    """Import roster data for all teams in a given season"""
+# Rows per upsert request; ID lookups go in the URL as an in.() filter, so they use smaller chunks
+UPSERT_CHUNK_SIZE = 1000
+LOOKUP_CHUNK_SIZE = 500
+
+def get_existing_players(athlete_ids):
+    """Fetch first/last season of the players that already exist, keyed by id"""
+    existing_players = {}
+    for i in range(0, len(athlete_ids), LOOKUP_CHUNK_SIZE):
+        response = supabase.table('players').select('id, first_season, last_season').in_(
+            'id', athlete_ids[i:i + LOOKUP_CHUNK_SIZE]
+        ).execute()
+        existing_players.update((p['id'], p) for p in response.data)
+    return existing_players
+
+# Seasons fetched from the API at once - kept small to respect the API's rate limits
+FETCH_WORKERS = 4
+
+def fetch_rosters(season):
+    """Fetch ALL rosters for a season in ONE API call. Returns (rosters, error)"""
+    url = f"{CBBD_API_BASE}/teams/roster"
+    params = {'season': season}
+    try:
+        response = session.get(url, params=params, timeout=30)
+        response.raise_for_status()
+        return response.json(), None
+    except Exception as e:
+        return None, e
+
+def load_all_players():
+    """Fetch first/last season of every stored player, keyed by id, a page at a time"""
+    existing_players = {}
+    page_size = 1000  # PostgREST's default max rows per response
+    start = 0
+    while True:
+        response = supabase.table('players').select('id, first_season, last_season').order('id').range(
+            start, start + page_size - 1
+        ).execute()
+        # The server may cap pages below page_size, so only an empty page means the end
+        if not response.data:
+            return existing_players
+        existing_players.update((p['id'], p) for p in response.data)
+        start += len(response.data)
+
+def get_team_lookup():
+    """Map API team source_id -> our team id"""
+    return {str(t['source_id']): t['id'] for t in get_all_teams() if t.get('source_id')}
+
+def import_roster_for_season(season, fetched=None, existing_players=None, team_lookup=None):
+    """Import roster data for all teams in a given season
+
+    fetched is a prefetched fetch_rosters() result; existing_players is the in-memory
+    player table from load_all_players(), kept up to date with this season's upserts;
+    team_lookup is a get_team_lookup() result shared across seasons
+    """
     print(f"\n{'='*60}")
     print(f"SEASON {season}")
     print(f"{'='*60}")
     
-    # Fetch ALL rosters for this season in ONE API call
-    print(f"[1/3] Fetching roster data from API...")
-    url = f"{CBBD_API_BASE}/teams/roster"
-    params = {'season': season}
+    print(f"[1/4] Fetching roster data from API...")
+    all_rosters, fetch_error = fetched or fetch_rosters(season)
     
     try:
-        response = requests.get(url, params=params, headers=HEADERS, timeout=30)
-        response.raise_for_status()
-        all_rosters = response.json()
+        if fetch_error:
+            raise fetch_error
         
         if not all_rosters:
             print(f"⚠️  No roster data available for season {season}")
@@ -76,36 +128,19 @@ def import_roster_for_season(season):
             'errors': [f"API error: {e}"]
         }
     
-    # Get all teams from database ONCE
-    print(f"[2/3] Loading teams from database...")
-    all_teams = get_all_teams()
-    team_lookup = {str(t['source_id']): t['id'] for t in all_teams if t.get('source_id')}
+    # Teams are loaded once per run - only fetched here when no lookup was passed in
+    print(f"[2/4] Loading teams from database...")
+    if team_lookup is None:
+        team_lookup = get_team_lookup()
     print(f"✓ Loaded {len(team_lookup)} Division I teams")
     
-    print(f"[3/3] Processing players and roster entries...")
-    players_updated = 0
-    rosters_inserted = 0
     errors = []
     teams_without_match = []
+    matched_rosters = []
     
     start_time = time.time()
-    last_update = start_time
-    
-    for idx, roster_data in enumerate(all_rosters, 1):
-        # Progress update every 100 teams OR every 10 seconds
-        current_time = time.time()
-        if idx % 100 == 0 or (current_time - last_update) >= 10:
-            elapsed = current_time - start_time
-            rate = idx / elapsed if elapsed > 0 else 0
-            remaining = (len(all_rosters) - idx) / rate if rate > 0 else 0
-            
-            print(f"  → {idx}/{len(all_rosters)} teams | "
-                  f"Players: {players_updated:,} | "
-                  f"Rosters: {rosters_inserted:,} | "
-                  f"Errors: {len(errors)} | "
-                  f"ETA: {int(remaining)}s")
-            last_update = current_time
-        
+    
+    for roster_data in all_rosters:
         # Get team identifiers from API response
         team_source_id = str(roster_data.get('teamSourceId'))
         team_name = roster_data.get('team', 'unknown')
@@ -118,23 +153,61 @@ def import_roster_for_season(season):
         
         # Process players for this team
         players = roster_data.get('players', [])
-        if not players:
-            continue
-
+        if players:
+            matched_rosters.append((team_id, players))
+    
+    # Existence checks are dict lookups - players are only fetched here when no table was preloaded,
+    # and then with one lookup per chunk of IDs instead of a SELECT per player
+    print(f"[3/4] Checking existing players...")
+    athlete_ids = sorted({player['id'] for _, players in matched_rosters for player in players if player.get('id') is not None})
+    if existing_players is None:
+        existing_players = get_existing_players(athlete_ids)
+    known_count = sum(1 for athlete_id in athlete_ids if athlete_id in existing_players)
+    print(f"✓ {known_count:,} of {len(athlete_ids):,} players already exist")
+    
+    # Build every player and roster row in memory first. A player listed more than once
+    # is merged into one row, since a single upsert can't touch the same row twice
+    print(f"[4/4] Upserting players and roster entries...")
+    now_iso = datetime.now(timezone.utc).isoformat()
+    player_rows = {}
+    roster_entries = {}
+    
+    for team_id, players in matched_rosters:
         for player in players:
             try:
-                # Process player
-                upsert_player(player, season)
-                players_updated += 1
+                athlete_id = player['id']
+                player_rows[athlete_id] = build_player_row(
+                    player, season, existing_players.get(athlete_id), player_rows.get(athlete_id), now_iso
+                )
                 
-                # Process roster entry
-                upsert_roster_entry(player, team_id, season)
-                rosters_inserted += 1
+                roster_entry = build_roster_entry(player, team_id, season)
+                roster_entries[(athlete_id, team_id, season)] = roster_entry
                     
             except Exception as e:
                 error_msg = f"Player {player.get('name', 'unknown')} ({player.get('id', 'unknown')}): {e}"
                 errors.append(error_msg)
     
+    # Players go first - roster entries reference them
+    players_updated, player_failures = upsert_players(list(player_rows.values()))
+    failed_ids = set()
+    for row, e in player_failures:
+        failed_ids.add(row['id'])
+        errors.append(f"Player {row.get('name', 'unknown')} ({row['id']}): {e}")
+    
+    # Record the stored seasons so later seasons merge against them without re-fetching
+    for athlete_id, row in player_rows.items():
+        if athlete_id not in failed_ids:
+            existing_players[athlete_id] = {
+                'id': athlete_id,
+                'first_season': row['first_season'],
+                'last_season': row['last_season'],
+            }
+    
+    roster_rows = [entry for entry in roster_entries.values() if entry['athlete_id'] not in failed_ids]
+    rosters_inserted, roster_failures = upsert_roster_entries(roster_rows)
+    for entry, e in roster_failures:
+        errors.append(f"Roster entry athlete {entry['athlete_id']} team {entry['team_id']}: {e}")
+    
     total_time = time.time() - start_time
     
     print(f"\n{'='*60}")
@@ -161,14 +234,15 @@ def import_roster_for_season(season):
         'errors': errors
     }
 
-def upsert_player(player_data, current_season):
-    """Update or insert player in players table"""
+def build_player_row(player_data, current_season, existing_player, previous_row, now_iso):
+    """Build the players upsert row, merging seasons with the stored player or a row built earlier this season"""
     athlete_id = player_data['id']
+    known_player = previous_row or existing_player
     
-    # Check if player exists
-    existing = supabase.table('players').select('*').eq('id', athlete_id).execute()
-    
-    player_update = {
+    # Start from the row built earlier this season, if any, so fields the API omits this time are kept
+    player_update = dict(previous_row or {})
+    player_update.update({
+        'id': athlete_id,
         'name': player_data['name'],
         'first_name': player_data.get('firstName'),
         'last_name': player_data.get('lastName'),
@@ -176,8 +250,8 @@ def upsert_player(player_data, current_season):
         'height': player_data.get('height'),
         'weight': player_data.get('weight'),
         'roster_data_available': True,
-        'updated_at': datetime.now(timezone.utc).isoformat()
-    }
+        'updated_at': now_iso
+    })
     
     # Handle hometown data
     hometown = player_data.get('hometown', {})
@@ -188,39 +262,114 @@ def upsert_player(player_data, current_season):
             'hometown_country': hometown.get('country')
         })
     
-    if existing.data:
+    if known_player:
         # Player exists - update first_season if this is earlier
-        existing_player = existing.data[0]
         player_start_season = player_data.get('startSeason', current_season)
         
         player_update['first_season'] = min(
-            existing_player['first_season'], 
+            known_player['first_season'], 
             player_start_season
         )
         player_update['last_season'] = max(
-            existing_player.get('last_season', 0) or 0,
+            known_player.get('last_season', 0) or 0,
             player_data.get('endSeason', current_season)
         )
-        
-        # Update existing player
-        supabase.table('players').update(player_update).eq('id', athlete_id).execute()
     else:
-        # New player - insert
+        # New player - source_id is only set on insert, so a stored one is never overwritten
         player_update.update({
-            'id': athlete_id,
             'source_id': player_data.get('sourceId'),
             'first_season': player_data.get('startSeason', current_season),
             'last_season': player_data.get('endSeason', current_season),
-            'created_at': datetime.now(timezone.utc).isoformat()
+            'created_at': now_iso
         })
-        
-        supabase.table('players').insert(player_update).execute()
     
-    return True
+    return player_update
+
+def upsert_players(rows):
+    """Upsert player rows in chunks, retrying a failed chunk one row at a time. Returns (upserted, failures)"""
+    upserted = 0
+    failures = []
+    
+    # Every row in one request needs the same keys - only new players carry created_at and source_id,
+    # and hometown fields are only sent when the API has them
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row), []).append(row)
+    
+    for group in groups.values():
+        for i in range(0, len(group), UPSERT_CHUNK_SIZE):
+            chunk = group[i:i + UPSERT_CHUNK_SIZE]
+            try:
+                supabase.table('players').upsert(chunk, on_conflict='id').execute()
+                upserted += len(chunk)
+            except Exception:
+                for row in chunk:
+                    try:
+                        supabase.table('players').upsert(row, on_conflict='id').execute()
+                        upserted += 1
+                    except Exception as e:
+                        failures.append((row, e))
+    
+    return upserted, failures
+
+# Optional single-transaction roster upsert through a stored function - the whole season
+# commits once instead of once per chunk. Create the function once in the Supabase SQL editor:
+#
+#   create or replace function import_roster_batch(payload jsonb)
+#   returns integer language plpgsql as $$
+#   declare upserted integer;
+#   begin
+#     insert into player_team_rosters (athlete_id, team_id, season, jersey, position, height, weight)
+#     select athlete_id, team_id, season, jersey, position, height, weight
+#     from jsonb_populate_recordset(null::player_team_rosters, payload)
+#     on conflict (athlete_id, team_id, season) do update set
+#       jersey = excluded.jersey, position = excluded.position,
+#       height = excluded.height, weight = excluded.weight;
+#     get diagnostics upserted = row_count;
+#     return upserted;
+#   end;
+#   $$;
+USE_BULK_RPC = os.getenv('IMPORT_USE_BULK_RPC') == '1'
+if USE_BULK_RPC:
+    print("✓ Upserting each season's roster entries through import_roster_batch()")
 
-def upsert_roster_entry(player_data, team_id, season):
-    """Insert or update roster entry in player_team_rosters"""
-    roster_entry = {
+def upsert_roster_entries(rows):
+    """Upsert roster entries in chunks, retrying a failed chunk one row at a time. Returns (upserted, failures)"""
+    upserted = 0
+    failures = []
+    
+    # One call and one commit for the season; on failure fall back to the chunked upserts
+    if USE_BULK_RPC and rows:
+        try:
+            supabase.rpc('import_roster_batch', {'payload': rows}).execute()
+            return len(rows), failures
+        except Exception as e:
+            print(f"  ⚠️  import_roster_batch() failed, falling back to chunked upserts: {str(e)[:80]}")
+    
+    for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        chunk = rows[i:i + UPSERT_CHUNK_SIZE]
+        try:
+            supabase.table('player_team_rosters').upsert(
+                chunk,
+                on_conflict='athlete_id,team_id,season'
+            ).execute()
+            upserted += len(chunk)
+        except Exception:
+            for row in chunk:
+                try:
+                    supabase.table('player_team_rosters').upsert(
+                        row,
+                        on_conflict='athlete_id,team_id,season'
+                    ).execute()
+                    upserted += 1
+                except Exception as e:
+                    failures.append((row, e))
+    
+    return upserted, failures
+
+def build_roster_entry(player_data, team_id, season):
+    """Build the player_team_rosters upsert row"""
+    return {
         'athlete_id': player_data['id'],
         'team_id': team_id,
         'season': season,
@@ -229,14 +378,6 @@ def upsert_roster_entry(player_data, team_id, season):
         'height': player_data.get('height'),
         'weight': player_data.get('weight')
     }
-    
-    # Upsert (insert or update if exists)
-    supabase.table('player_team_rosters').upsert(
-        roster_entry,
-        on_conflict='athlete_id,team_id,season'
-    ).execute()
-    
-    return True
 
 def save_progress(results):
     """Save progress to a log file"""
@@ -257,15 +398,23 @@ def run_full_import():
     print("🏀 Starting full roster import for seasons 2005-2026...")
     print(f"Start time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    for season in seasons:
-        result = import_roster_for_season(season)
-        all_results.append(result)
-        
-        # Save progress after each season
-        save_progress(all_results)
-        
-        # Small delay between seasons
-        time.sleep(0.5)
+    # The teams table is static for the run - load it once
+    team_lookup = get_team_lookup()
+    
+    # Load the player table once - each season's upserts are folded back into it
+    print("Loading existing players...")
+    existing_players = load_all_players()
+    print(f"✓ Loaded {len(existing_players):,} players")
+    
+    # Fetch seasons concurrently while earlier seasons are written - results come back in
+    # season order, and the database writes stay one season at a time
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        for season, fetched in zip(seasons, executor.map(fetch_rosters, seasons)):
+            result = import_roster_for_season(season, fetched, existing_players, team_lookup)
+            all_results.append(result)
+            
+            # Save progress after each season
+            save_progress(all_results)
     
     print("\n" + "="*60)
     print("🎉 IMPORT COMPLETE!")
@@ -1,22 +1,15 @@
 import pandas as pd
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import numpy as np
+from common import SUPABASE_URL, CSV_READ_OPTIONS, MAX_BODY_BYTES, get_client, iter_batches, list_csv_files
+from postgrest.types import CountMethod, ReturnMethod
 import os
-import glob
-import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime
 
-# Load environment variables
-load_dotenv()
-
-# Initialize Supabase client
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in .env file")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Initialize Supabase client - its HTTP/2 pool is shared by the file worker threads
+supabase = get_client()
 
 print("🏀 Starting Team Game Stats Import...")
 print(f"📊 Connected to Supabase: {SUPABASE_URL}")
@@ -144,54 +137,140 @@ COLUMN_MAPPING = {
     'opponentStats_rating': 'opponent_rating',
 }
 
-# Option to clear existing data
-print("\n❓ Clear existing data in team_game_stats table first?")
-print("1. Yes - delete all existing stats")
-print("2. No - attempt to add to existing data")
-clear_choice = input("Enter choice (1 or 2): ").strip()
+# Define which columns are integers vs decimals - sets so membership checks are hash lookups
+INTEGER_COLUMNS = frozenset({
+    'game_id', 'team_id', 'season', 'opponent_id', 'game_minutes',
+    'team_seed', 'opponent_seed',
+    # All "made" and "attempted" stats are integers
+    'team_field_goals_attempted', 'team_field_goals_made',
+    'team_two_point_field_goals_attempted', 'team_two_point_field_goals_made',
+    'team_three_point_field_goals_attempted', 'team_three_point_field_goals_made',
+    'team_free_throws_attempted', 'team_free_throws_made',
+    'team_rebounds_total', 'team_rebounds_defensive', 'team_rebounds_offensive',
+    'team_turnovers_team_total', 'team_turnovers_total',
+    'team_fouls_flagrant', 'team_fouls_technical', 'team_fouls_total',
+    'team_points_fast_break', 'team_points_off_turnovers', 'team_points_in_paint',
+    'team_points_total', 'team_points_largest_lead',
+    'team_points_by_period_0', 'team_points_by_period_1', 'team_points_by_period_2',
+    'team_points_by_period_3', 'team_points_by_period_4', 'team_points_by_period_5',
+    'team_points_by_period_6', 'team_points_by_period_7', 'team_points_by_period_8', 
+    'team_points_by_period_9', 'team_points_by_period_10',
+    'team_assists', 'team_blocks', 'team_steals', 'team_possessions',
+    # Opponent stats - same pattern
+    'opponent_field_goals_attempted', 'opponent_field_goals_made',
+    'opponent_two_point_field_goals_attempted', 'opponent_two_point_field_goals_made',
+    'opponent_three_point_field_goals_attempted', 'opponent_three_point_field_goals_made',
+    'opponent_free_throws_attempted', 'opponent_free_throws_made',
+    'opponent_rebounds_total', 'opponent_rebounds_defensive', 'opponent_rebounds_offensive',
+    'opponent_turnovers_team_total', 'opponent_turnovers_total',
+    'opponent_fouls_flagrant', 'opponent_fouls_technical', 'opponent_fouls_total',
+    'opponent_points_fast_break', 'opponent_points_off_turnovers', 'opponent_points_in_paint',
+    'opponent_points_total', 'opponent_points_largest_lead',
+    'opponent_points_by_period_0', 'opponent_points_by_period_1', 'opponent_points_by_period_2',
+    'opponent_points_by_period_3', 'opponent_points_by_period_4', 'opponent_points_by_period_5',
+    'opponent_points_by_period_6', 'opponent_points_by_period_7', 'opponent_points_by_period_8', 
+    'opponent_points_by_period_9', 'opponent_points_by_period_10',
+    'opponent_assists', 'opponent_blocks', 'opponent_steals', 'opponent_possessions',
+})
 
-if clear_choice == "1":
-    print("\n🗑️  Clearing existing data...")
-    print("   Run this SQL command manually in Supabase:")
-    print("   DELETE FROM team_game_stats;")
-    print("\n   Press Enter when done...")
-    input()
+STRING_COLUMNS = frozenset({'team', 'opponent', 'season_label', 'season_type', 'game_type', 'notes', 'tournament', 'start_date'})
+BOOLEAN_COLUMNS = frozenset({'neutral_site', 'is_home', 'conference_game', 'start_time_tbd'})
 
-# Find all CSV files in team_game_stats folder
-csv_folder = 'team_game_stats'
-csv_files = sorted(glob.glob(f'{csv_folder}/*.csv'))
+@lru_cache(maxsize=None)
+def column_families(columns):
+    """Split a header into (boolean, integer, decimal) column lists - worked out once per
+    header layout, since every year's file normally shares the same one"""
+    bool_cols = [col for col in columns if col in BOOLEAN_COLUMNS]
+    int_cols = [col for col in columns if col in INTEGER_COLUMNS]
+    decimal_cols = [col for col in columns
+                    if col not in STRING_COLUMNS and col not in BOOLEAN_COLUMNS and col not in INTEGER_COLUMNS]
+    return bool_cols, int_cols, decimal_cols
 
-if not csv_files:
-    print(f"\n❌ No CSV files found in {csv_folder}/ folder!")
-    print(f"   Make sure you have files like: {csv_folder}/2024.csv")
-    exit(1)
+# CSV headers that get renamed - intersected with each file's header instead of scanning the mapping
+MAPPING_KEYS = frozenset(COLUMN_MAPPING)
 
-print(f"\n📂 Found {len(csv_files)} CSV files to import:")
-for f in csv_files:
-    print(f"   - {os.path.basename(f)}")
+# Upload size - a ~12k-row year goes out in a few large requests; batches are closed early
+# when needed so each JSON body stays under MAX_BODY_BYTES
+BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '5000'))
 
-# Track overall progress
-total_records = 0
-total_inserted = 0
-failed_files = []
-file_summary = []
+# Optional skip of rows already in the table (IMPORT_SKIP_EXISTING=1) - e.g. when re-running a
+# year. Postgres skips (game_id, team_id) conflicts instead of failing the batch, which needs a
+# unique index. Create it once in the Supabase SQL editor:
+#
+#   create unique index if not exists ux_team_game_stats_game_team on team_game_stats (game_id, team_id);
+SKIP_EXISTING = os.getenv('IMPORT_SKIP_EXISTING') == '1'
+if SKIP_EXISTING:
+    print("📊 Skipping rows whose (game_id, team_id) is already in team_game_stats")
+
+# Optional direct Postgres connection - when set, bulk loads use COPY instead of REST inserts
+SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL')
+db_conn = None
+if SUPABASE_DB_URL:
+    import psycopg
+    from psycopg import sql
+    db_conn = psycopg.connect(SUPABASE_DB_URL, autocommit=True)
+    print("📊 Bulk loading with COPY over a direct Postgres connection")
+
+# Files are processed on several threads, but one connection runs one COPY at a time
+copy_lock = threading.Lock()
+
+def copy_records(rows):
+    """Bulk load a cleaned DataFrame with COPY in one transaction. Returns the rows inserted"""
+    column_list = sql.SQL(', ').join(map(sql.Identifier, rows.columns.tolist()))
+    with copy_lock, db_conn.transaction(), db_conn.cursor() as cur:
+        if not SKIP_EXISTING:
+            with cur.copy(sql.SQL("COPY team_game_stats ({}) FROM STDIN").format(column_list)) as copy:
+                for row in rows.itertuples(index=False, name=None):
+                    copy.write_row(row)
+            return len(rows)
+        
+        # COPY can't skip conflicts itself - load a staging table, then insert what's new
+        cur.execute("CREATE TEMP TABLE team_game_stats_staging (LIKE team_game_stats INCLUDING DEFAULTS) ON COMMIT DROP")
+        with cur.copy(sql.SQL("COPY team_game_stats_staging ({}) FROM STDIN").format(column_list)) as copy:
+            for row in rows.itertuples(index=False, name=None):
+                copy.write_row(row)
+        cur.execute(sql.SQL(
+            "INSERT INTO team_game_stats ({cols}) SELECT {cols} FROM team_game_stats_staging "
+            "ON CONFLICT (game_id, team_id) DO NOTHING"
+        ).format(cols=column_list))
+        return cur.rowcount
 
-# Process each CSV file
-for csv_file in csv_files:
+def insert_records(batch):
+    """Insert a batch. Returns the rows inserted - with SKIP_EXISTING, rows Postgres skipped aren't counted"""
+    if not SKIP_EXISTING:
+        supabase.table('team_game_stats').insert(batch).execute()
+        return len(batch)
+    response = supabase.table('team_game_stats').upsert(
+        batch, on_conflict='game_id,team_id', ignore_duplicates=True,
+        count=CountMethod.exact, returning=ReturnMethod.minimal,
+    ).execute()
+    return response.count
+
+def process_csv(csv_file):
+    """Read, clean and upload one year's CSV. Output is collected in result['log'] so
+    files processed concurrently still print one after another"""
     filename = os.path.basename(csv_file)
     year = filename.replace('.csv', '')
     
-    print(f"\n{'='*60}")
-    print(f"📅 Processing {year}...")
-    print(f"{'='*60}")
+    result = {
+        'filename': filename,
+        'year': year,
+        'log': [],
+        'total': 0,
+        'inserted': 0,
+        'failed': 0,
+        'skipped': 0,
+        'error': None,
+    }
+    log = result['log']
     
     try:
-        # Read CSV
-        df = pd.read_csv(csv_file, low_memory=False)
-        print(f"   ✅ Loaded {len(df)} game-team records from {filename}")
+        # Read CSV - with pyarrow installed, columns arrive typed and the cleaning below is mostly a no-op
+        df = pd.read_csv(csv_file, **CSV_READ_OPTIONS)
+        log.append(f"   ✅ Loaded {len(df)} game-team records from {filename}")
         
         # Rename columns to snake_case (only columns that exist in mapping)
-        rename_dict = {k: v for k, v in COLUMN_MAPPING.items() if k in df.columns}
+        rename_dict = {k: COLUMN_MAPPING[k] for k in MAPPING_KEYS.intersection(df.columns)}
         df = df.rename(columns=rename_dict)
         
         # Drop consolidated byPeriod columns (we use individual period columns instead)
@@ -209,118 +288,139 @@ for csv_file in csv_files:
         df = df.drop_duplicates(subset=['game_id', 'team_id'], keep='first')
         duplicates_removed = initial_count - len(df)
         if duplicates_removed > 0:
-            print(f"   🔧 Removed {duplicates_removed} duplicate rows")
+            log.append(f"   🔧 Removed {duplicates_removed} duplicate rows")
+        
+        # Clean data types - one vectorized conversion per type family
+        bool_cols, int_cols, decimal_cols = column_families(tuple(df.columns))
+        
+        # Boolean columns
+        df[bool_cols] = df[bool_cols].fillna(False).astype(bool)
         
-        # Define which columns are integers vs decimals
-        integer_columns = [
-            'game_id', 'team_id', 'season', 'opponent_id', 'game_minutes',
-            'team_seed', 'opponent_seed',
-            # All "made" and "attempted" stats are integers
-            'team_field_goals_attempted', 'team_field_goals_made',
-            'team_two_point_field_goals_attempted', 'team_two_point_field_goals_made',
-            'team_three_point_field_goals_attempted', 'team_three_point_field_goals_made',
-            'team_free_throws_attempted', 'team_free_throws_made',
-            'team_rebounds_total', 'team_rebounds_defensive', 'team_rebounds_offensive',
-            'team_turnovers_team_total', 'team_turnovers_total',
-            'team_fouls_flagrant', 'team_fouls_technical', 'team_fouls_total',
-            'team_points_fast_break', 'team_points_off_turnovers', 'team_points_in_paint',
-            'team_points_total', 'team_points_largest_lead',
-            'team_points_by_period_0', 'team_points_by_period_1', 'team_points_by_period_2',
-            'team_points_by_period_3', 'team_points_by_period_4', 'team_points_by_period_5',
-            'team_points_by_period_6', 'team_points_by_period_7', 'team_points_by_period_8', 
-            'team_points_by_period_9', 'team_points_by_period_10',
-            'team_assists', 'team_blocks', 'team_steals', 'team_possessions',
-            # Opponent stats - same pattern
-            'opponent_field_goals_attempted', 'opponent_field_goals_made',
-            'opponent_two_point_field_goals_attempted', 'opponent_two_point_field_goals_made',
-            'opponent_three_point_field_goals_attempted', 'opponent_three_point_field_goals_made',
-            'opponent_free_throws_attempted', 'opponent_free_throws_made',
-            'opponent_rebounds_total', 'opponent_rebounds_defensive', 'opponent_rebounds_offensive',
-            'opponent_turnovers_team_total', 'opponent_turnovers_total',
-            'opponent_fouls_flagrant', 'opponent_fouls_technical', 'opponent_fouls_total',
-            'opponent_points_fast_break', 'opponent_points_off_turnovers', 'opponent_points_in_paint',
-            'opponent_points_total', 'opponent_points_largest_lead',
-            'opponent_points_by_period_0', 'opponent_points_by_period_1', 'opponent_points_by_period_2',
-            'opponent_points_by_period_3', 'opponent_points_by_period_4', 'opponent_points_by_period_5',
-            'opponent_points_by_period_6', 'opponent_points_by_period_7', 'opponent_points_by_period_8', 
-            'opponent_points_by_period_9', 'opponent_points_by_period_10',
-            'opponent_assists', 'opponent_blocks', 'opponent_steals', 'opponent_possessions',
-        ]
+        # Integer columns - use Int64 to handle NaN
+        df[int_cols] = df[int_cols].apply(pd.to_numeric, errors='coerce').astype('Int64')
         
-        # Clean data types
-        for col in df.columns:
-            if col in ['team', 'opponent', 'season_label', 'season_type', 'game_type', 'notes', 'tournament', 'start_date']:
-                continue  # Skip string columns
-            elif col in ['neutral_site', 'is_home', 'conference_game', 'start_time_tbd']:
-                # Boolean columns
-                df[col] = df[col].fillna(False).astype(bool)
-            elif col in integer_columns:
-                # Integer columns - use Int64 to handle NaN
-                df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
-            else:
-                # Decimal columns (percentages, ratings, etc.)
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+        # Decimal columns (percentages, ratings, etc.) - inf is masked across all of them in
+        # one np.isfinite call, and becomes None with the NaNs below
+        decimals = df[decimal_cols].apply(pd.to_numeric, errors='coerce')
+        df[decimal_cols] = decimals.where(np.isfinite(decimals))
         
         # Handle date column
         if 'start_date' in df.columns:
             df['start_date'] = pd.to_datetime(df['start_date'], errors='coerce').dt.strftime('%Y-%m-%d')
         
-        # Replace NaN with None - CRITICAL for Supabase
-        df = df.replace({float('nan'): None, float('inf'): None, float('-inf'): None})
+        # The object cast turns every NaN/NA into None in one pass - CRITICAL for Supabase.
+        # Records are built one batch at a time from this frame instead of for the whole file
+        rows = df.astype(object).where(df.notna(), None)
         
-        # Convert to records
-        records = df.to_dict('records')
-        
-        # Double-check: Replace any remaining NaN values
-        for record in records:
-            for key, value in record.items():
-                if value is not None and isinstance(value, float):
-                    if math.isnan(value) or math.isinf(value):
-                        record[key] = None
+        result['total'] = len(rows)
+        file_inserted = 0
+        file_failed = 0
+        copied = False
         
-        total_records += len(records)
+        # COPY the whole year when a direct connection is available
+        if db_conn and len(rows):
+            try:
+                file_inserted = copy_records(rows)
+                copied = True
+                log.append(f"   ✅ Copied {file_inserted} records")
+            except Exception as e:
+                log.append(f"   ⚠️  COPY failed, falling back to batch inserts: {str(e)[:80]}")
         
         # Import in batches
-        batch_size = 500  # Optimal for ~12k rows per file
-        file_inserted = 0
-        file_failed = 0
+        upload = rows.iloc[:0] if copied else rows
+        columns = list(upload.columns)
+        records = (dict(zip(columns, row)) for row in upload.itertuples(index=False, name=None))
         
-        for i in range(0, len(records), batch_size):
-            batch = records[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            total_batches = (len(records) + batch_size - 1) // batch_size
-            
+        for batch_num, batch in enumerate(iter_batches(records, MAX_BODY_BYTES, BATCH_SIZE), 1):
             try:
-                supabase.table('team_game_stats').insert(batch).execute()
-                file_inserted += len(batch)
-                total_inserted += len(batch)
-                print(f"   ✅ Batch {batch_num}/{total_batches}: Inserted {len(batch)} records")
+                inserted = insert_records(batch)
+                file_inserted += inserted
+                log.append(f"   ✅ Batch {batch_num}: Inserted {inserted} records")
             except Exception as e:
-                print(f"   ⚠️  Batch {batch_num} failed, retrying individually...")
+                log.append(f"   ⚠️  Batch {batch_num} failed, retrying individually...")
                 
                 for record in batch:
                     try:
-                        supabase.table('team_game_stats').insert([record]).execute()
-                        file_inserted += 1
-                        total_inserted += 1
+                        file_inserted += insert_records([record])
                     except Exception as record_error:
                         file_failed += 1
                         game_info = f"Game {record.get('game_id', '?')}, {record.get('team', 'Unknown')}"
                         error_msg = str(record_error)[:80]
-                        print(f"      ❌ {game_info}: {error_msg}")
+                        log.append(f"      ❌ {game_info}: {error_msg}")
         
-        file_summary.append({
-            'year': year,
-            'total': len(records),
-            'inserted': file_inserted,
-            'failed': file_failed
-        })
+        result['inserted'] = file_inserted
+        result['failed'] = file_failed
+        # Rows neither inserted nor failed were already in the table (SKIP_EXISTING only)
+        result['skipped'] = len(rows) - file_inserted - file_failed
         
-        print(f"   📊 {year} Summary: {file_inserted} inserted, {file_failed} failed")
+        log.append(f"   📊 {year} Summary: {file_inserted} inserted, {file_failed} failed")
+        if result['skipped']:
+            log.append(f"   ⏭️  Skipped {result['skipped']} rows already in the table")
         
     except Exception as e:
-        print(f"   ❌ Error processing {filename}: {e}")
-        failed_files.append({'file': filename, 'error': str(e)})
+        result['error'] = str(e)
+    
+    return result
+
+# Option to clear existing data
+print("\n❓ Clear existing data in team_game_stats table first?")
+print("1. Yes - delete all existing stats")
+print("2. No - attempt to add to existing data")
+clear_choice = input("Enter choice (1 or 2): ").strip()
+
+if clear_choice == "1":
+    print("\n🗑️  Clearing existing data...")
+    print("   Run this SQL command manually in Supabase:")
+    print("   DELETE FROM team_game_stats;")
+    print("\n   Press Enter when done...")
+    input()
+
+# Find all CSV files in team_game_stats folder
+csv_folder = 'team_game_stats'
+csv_files = list_csv_files(csv_folder)
+
+if not csv_files:
+    print(f"\n❌ No CSV files found in {csv_folder}/ folder!")
+    print(f"   Make sure you have files like: {csv_folder}/2024.csv")
+    exit(1)
+
+print(f"\n📂 Found {len(csv_files)} CSV files to import:")
+for f in csv_files:
+    print(f"   - {os.path.basename(f)}")
+
+# Track overall progress
+total_records = 0
+total_inserted = 0
+total_skipped = 0
+failed_files = []
+file_summary = []
+
+# Process CSV files concurrently - each file's upload is bound by network latency, so
+# FILE_WORKERS files are in flight at once; results are reported in year order
+FILE_WORKERS = int(os.getenv('IMPORT_FILE_WORKERS', '4'))
+
+with ThreadPoolExecutor(max_workers=FILE_WORKERS) as executor:
+    for result in executor.map(process_csv, csv_files):
+        print(f"\n{'='*60}")
+        print(f"📅 Processing {result['year']}...")
+        print(f"{'='*60}")
+        for line in result['log']:
+            print(line)
+        
+        if result['error']:
+            print(f"   ❌ Error processing {result['filename']}: {result['error']}")
+            failed_files.append({'file': result['filename'], 'error': result['error']})
+            continue
+        
+        total_records += result['total']
+        total_inserted += result['inserted']
+        total_skipped += result['skipped']
+        file_summary.append({
+            'year': result['year'],
+            'total': result['total'],
+            'inserted': result['inserted'],
+            'failed': result['failed']
+        })
 
 # Final Summary
 print("\n" + "="*60)
@@ -329,7 +429,9 @@ print("="*60)
 print(f"Total CSV files processed: {len(csv_files)}")
 print(f"Total records: {total_records:,}")
 print(f"Successfully inserted: {total_inserted:,}")
-print(f"Failed: {total_records - total_inserted:,}")
+if total_skipped:
+    print(f"Skipped (already in table): {total_skipped:,}")
+print(f"Failed: {total_records - total_inserted - total_skipped:,}")
 
 print("\n📅 By Year:")
 for summary in file_summary:
@@ -359,4 +461,7 @@ try:
 except Exception as e:
     print(f"❌ Verification failed: {e}")
 
+if db_conn:
+    db_conn.close()
+
 print("\n✨ Import complete!")
\ No newline at end of file
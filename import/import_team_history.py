@@ -1,21 +1,19 @@
 import os
+import bisect
+import time
 import requests
-from dotenv import load_dotenv
-from supabase import create_client, Client
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from common import RateLimiter, get_client, json_loads, json_dumps_indented
 from typing import Dict, List, Optional
-import time
+from concurrent.futures import ThreadPoolExecutor
 from collections import defaultdict
 
-# Load environment variables
-load_dotenv()
-
-# Configuration
+# Configuration - common has already loaded .env
 CBDB_API_KEY = os.getenv('CBDB_API_KEY')
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 
-# Initialize clients
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Initialize clients - the Supabase one is shared from common
+supabase = get_client()
 
 # API Configuration
 CBDB_BASE_URL = "https://api.collegebasketballdata.com"
@@ -24,6 +22,19 @@ HEADERS = {
     "Authorization": f"Bearer {CBDB_API_KEY}"
 }
 
+# Seasons are fetched concurrently over one keep-alive session. Requests are paced by a
+# token bucket (CBDB_REQUESTS_PER_SECOND); a 429 or gateway error that still happens is
+# retried with backoff, honoring Retry-After
+FETCH_WORKERS = 16
+api_limiter = RateLimiter(float(os.getenv('CBDB_REQUESTS_PER_SECOND', '10')))
+session = requests.Session()
+session.headers.update(HEADERS)
+session.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=FETCH_WORKERS,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504]),
+))
+
 # Logging
 class Logger:
     def __init__(self):
@@ -72,11 +83,77 @@ class Logger:
 
 logger = Logger()
 
+def api_get(path, **kwargs):
+    """GET a CBBD API path through the shared session, waiting for the rate limiter first"""
+    api_limiter.acquire()
+    return session.get(f"{CBDB_BASE_URL}{path}", **kwargs)
+
+# Rows per insert/upsert request
+WRITE_BATCH_SIZE = 1000
+
+# Optional direct Postgres connection - when set, plain inserts (the conference history and
+# gap-year rows) are loaded with COPY instead of REST inserts
+SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL')
+db_conn = None
+if SUPABASE_DB_URL:
+    import psycopg
+    from psycopg import sql
+    db_conn = psycopg.connect(SUPABASE_DB_URL, autocommit=True)
+    logger.info("Bulk loading history with COPY over a direct Postgres connection")
+
+def copy_rows(table, rows):
+    """Load rows with a single COPY in one transaction - all rows must share the first row's keys"""
+    columns = list(rows[0])
+    query = sql.SQL("COPY {} ({}) FROM STDIN").format(
+        sql.Identifier(table),
+        sql.SQL(', ').join(map(sql.Identifier, columns))
+    )
+    with db_conn.transaction(), db_conn.cursor() as cur:
+        with cur.copy(query) as copy:
+            for row in rows:
+                copy.write_row([row[col] for col in columns])
+
+def write_in_batches(table, rows, on_conflict=None):
+    """Insert rows (or upsert on on_conflict) in chunks, retrying a failed chunk one row at a time.
+    Returns (written, failures) where failures is a list of (row, error)"""
+    written = 0
+    failures = []
+    
+    # COPY plain inserts when a direct connection is available; if any row is rejected the
+    # whole COPY rolls back and the batched inserts below isolate the bad rows
+    if db_conn and rows and not on_conflict:
+        try:
+            copy_rows(table, rows)
+            return len(rows), failures
+        except Exception as e:
+            logger.warning(f"COPY into {table} failed, falling back to batch inserts: {str(e)[:80]}")
+    
+    def write(chunk):
+        if on_conflict:
+            supabase.table(table).upsert(chunk, on_conflict=on_conflict).execute()
+        else:
+            supabase.table(table).insert(chunk).execute()
+    
+    for i in range(0, len(rows), WRITE_BATCH_SIZE):
+        chunk = rows[i:i + WRITE_BATCH_SIZE]
+        try:
+            write(chunk)
+            written += len(chunk)
+        except Exception:
+            for row in chunk:
+                try:
+                    write([row])
+                    written += 1
+                except Exception as e:
+                    failures.append((row, e))
+    
+    return written, failures
+
 def fetch_conferences():
     """Fetch all conferences from CBBD API"""
     logger.info("Fetching conferences from API...")
     try:
-        response = requests.get(f"{CBDB_BASE_URL}/conferences", headers=HEADERS)
+        response = api_get("/conferences")
         response.raise_for_status()
         conferences = response.json()
         logger.info(f"Fetched {len(conferences)} conferences")
@@ -89,36 +166,59 @@ def upsert_conferences(conferences):
     """Insert or update conferences in the database"""
     logger.info("Upserting conferences to database...")
     
-    for conf in conferences:
-        try:
-            # Upsert conference
-            supabase.table('conferences').upsert({
-                'id': conf['id'],
-                'name': conf['name'],
-                'abbreviation': conf.get('abbreviation'),
-                'short_name': conf.get('shortName')
-            }, on_conflict='id').execute()
-            
-            logger.stat('conferences_processed')
-        except Exception as e:
-            logger.error(f"Failed to upsert conference {conf.get('name')}: {e}")
+    rows = [{
+        'id': conf['id'],
+        'name': conf['name'],
+        'abbreviation': conf.get('abbreviation'),
+        'short_name': conf.get('shortName')
+    } for conf in conferences]
+    
+    upserted, failures = write_in_batches('conferences', rows, on_conflict='id')
+    logger.stat('conferences_processed', upserted)
+    for row, e in failures:
+        logger.error(f"Failed to upsert conference {row.get('name')}: {e}")
     
     logger.info(f"Upserted {logger.stats['conferences_processed']} conferences")
 
+# Each season's API response is cached on disk, so a re-run within TEAMS_CACHE_TTL seconds
+# skips the download for that season. IMPORT_TEAMS_CACHE_TTL=0 always fetches
+TEAMS_CACHE_DIR = os.path.join('.cache', 'teams')
+TEAMS_CACHE_TTL = int(os.getenv('IMPORT_TEAMS_CACHE_TTL', str(24 * 60 * 60)))
+
 def fetch_teams_for_season(season: int) -> List[Dict]:
-    """Fetch teams for a specific season"""
+    """Fetch teams for a specific season, from the local cache when it is fresh"""
+    cache_path = os.path.join(TEAMS_CACHE_DIR, f"{season}.json")
     try:
-        response = requests.get(
-            f"{CBDB_BASE_URL}/teams",
-            params={'season': season},
-            headers=HEADERS
-        )
+        if TEAMS_CACHE_TTL > 0 and time.time() - os.path.getmtime(cache_path) < TEAMS_CACHE_TTL:
+            with open(cache_path, 'rb') as f:
+                return json_loads(f.read())
+    except (OSError, ValueError):
+        pass  # Missing or unreadable cache - fetch instead
+    
+    try:
+        response = api_get("/teams", params={'season': season})
         response.raise_for_status()
         teams = response.json()
-        return teams
     except Exception as e:
         logger.error(f"Failed to fetch teams for season {season}: {e}")
         return []
+    
+    # Only real responses are cached - an empty season is fetched again next run. A failed
+    # write only costs the cache; the temp file + replace never leaves a half-written one
+    if teams and TEAMS_CACHE_TTL > 0:
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(TEAMS_CACHE_DIR, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(json_dumps_indented(teams))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not cache teams for season {season}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+    return teams
 
 def collect_all_seasons_data():
     """Phase 1: Collect all season data and identify all unique teams"""
@@ -127,10 +227,14 @@ def collect_all_seasons_data():
     all_seasons_data = {}
     all_teams_map = {}
     
-    for season in range(1925, 2026):
-        logger.info(f"Fetching season {season}...")
-        teams = fetch_teams_for_season(season)
-        
+    # Requests run concurrently; results come back in season order so the
+    # most-recent-season bookkeeping below is unchanged
+    logger.info(f"Fetching seasons with {FETCH_WORKERS} concurrent requests...")
+    seasons = range(1925, 2026)
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        season_teams = list(executor.map(fetch_teams_for_season, seasons))
+    
+    for season, teams in zip(seasons, season_teams):
         if teams:
             all_seasons_data[season] = teams
             
@@ -140,21 +244,14 @@ def collect_all_seasons_data():
                 if not source_id:
                     continue
                 
-                if source_id not in all_teams_map:
+                # New team, or a more recent season - one lookup; re-assigning an existing
+                # key keeps its place, so teams are still upserted in first-seen order
+                known = all_teams_map.get(source_id)
+                if known is None or season > known['last_season']:
                     all_teams_map[source_id] = {
                         'last_season': season,
                         'data': team
                     }
-                else:
-                    # Update if this is a more recent season
-                    if season > all_teams_map[source_id]['last_season']:
-                        all_teams_map[source_id] = {
-                            'last_season': season,
-                            'data': team
-                        }
-        
-        # Rate limiting - be nice to the API
-        time.sleep(0.1)
     
     logger.info(f"Collected data for {len(all_seasons_data)} seasons")
     logger.info(f"Identified {len(all_teams_map)} unique teams")
@@ -165,41 +262,35 @@ def upsert_teams(all_teams_map):
     """Phase 2: Upsert teams table with most recent data"""
     logger.info("Phase 2: Upserting teams table...")
     
+    rows = []
     for source_id, team_info in all_teams_map.items():
         team = team_info['data']
         last_season = team_info['last_season']
         
         logger.stat('teams_processed')
         
-        try:
-            # Prepare team data (exclude conferenceId and conference)
-            team_data = {
-                'source_id': source_id,
-                'school': team.get('school'),
-                'mascot': team.get('mascot'),
-                'abbreviation': team.get('abbreviation'),
-                'display_name': team.get('displayName'),
-                'short_display_name': team.get('shortDisplayName'),
-                'primary_color': team.get('primaryColor'),
-                'secondary_color': team.get('secondaryColor'),
-                'current_venue_id': team.get('currentVenueId'),
-                'current_venue': team.get('currentVenue'),
-                'current_city': team.get('currentCity'),
-                'current_state': team.get('currentState'),
-                'last_active_season': last_season
-            }
-            
-            # Upsert team
-            supabase.table('teams').upsert(
-                team_data,
-                on_conflict='source_id'
-            ).execute()
-            
-            logger.stat('teams_successful')
-            
-        except Exception as e:
-            logger.error(f"Failed to upsert team {team.get('school')} ({source_id}): {e}")
-            logger.stat('teams_failed')
+        # Prepare team data (exclude conferenceId and conference)
+        rows.append({
+            'source_id': source_id,
+            'school': team.get('school'),
+            'mascot': team.get('mascot'),
+            'abbreviation': team.get('abbreviation'),
+            'display_name': team.get('displayName'),
+            'short_display_name': team.get('shortDisplayName'),
+            'primary_color': team.get('primaryColor'),
+            'secondary_color': team.get('secondaryColor'),
+            'current_venue_id': team.get('currentVenueId'),
+            'current_venue': team.get('currentVenue'),
+            'current_city': team.get('currentCity'),
+            'current_state': team.get('currentState'),
+            'last_active_season': last_season
+        })
+    
+    upserted, failures = write_in_batches('teams', rows, on_conflict='source_id')
+    logger.stat('teams_successful', upserted)
+    logger.stat('teams_failed', len(failures))
+    for row, e in failures:
+        logger.error(f"Failed to upsert team {row.get('school')} ({row['source_id']}): {e}")
     
     logger.info(f"Upserted {logger.stats['teams_successful']} teams successfully")
     logger.info(f"Failed to upsert {logger.stats['teams_failed']} teams")
@@ -220,29 +311,94 @@ def get_team_id_map():
     
     return team_id_map
 
-def find_eventual_conference(team_source_id: str, start_season: int, all_seasons_data: Dict) -> Optional[int]:
+def build_team_season_index(all_seasons_data: Dict):
+    """
+    Index the season data once: returns (sorted seasons with data,
+    source_id -> {season: [conference ids of that team's entries]})
+    """
+    team_seasons = defaultdict(dict)
+    for season, teams in all_seasons_data.items():
+        for t in teams:
+            sid = t.get('sourceId')
+            if sid:
+                team_seasons[sid].setdefault(season, []).append(t.get('conferenceId'))
+    return sorted(all_seasons_data), team_seasons
+
+def find_eventual_conference(team_source_id: str, start_season: int, season_index) -> Optional[int]:
     """
     Look forward from start_season to find first season 
     where team appears in only ONE conference
     """
-    for future_season in range(start_season + 1, 2026):
-        if future_season not in all_seasons_data:
-            continue
-        
-        teams_in_season = [t for t in all_seasons_data[future_season] 
-                          if t.get('sourceId') == team_source_id]
+    data_seasons, team_seasons = season_index
+    conferences_by_season = team_seasons.get(team_source_id, {})
+    
+    # Seasons without data are skipped, as before - start at the first one after start_season
+    for future_season in data_seasons[bisect.bisect_right(data_seasons, start_season):]:
+        conferences = conferences_by_season.get(future_season)
         
-        if len(teams_in_season) == 1:
-            # Found single appearance
-            return teams_in_season[0].get('conferenceId')
-        elif len(teams_in_season) == 0:
+        if not conferences:
             # Team doesn't exist in future - defunct case
             return None
+        elif len(conferences) == 1:
+            # Found single appearance
+            return conferences[0]
     
     # No single conference found in future
     return None
 
-def build_conference_history(all_seasons_data, team_id_map):
+# Optional server-side duplicate resolution - every raw (team_id, season, conference_id) entry
+# goes to Postgres in one call, which resolves duplicates the same way as the Python path below
+# and inserts the history in one transaction. Create the function once in the Supabase SQL editor:
+#
+#   create or replace function resolve_conference_history(raw jsonb, data_seasons int[])
+#   returns integer language plpgsql as $$
+#   declare inserted integer;
+#   begin
+#     insert into team_conference_history (team_id, season, conference_id, existed)
+#     with team_season as (
+#       select team_id, season, array_agg(conference_id order by conference_id) as conferences
+#       from jsonb_to_recordset(raw) as r(team_id int, season int, conference_id int)
+#       group by team_id, season
+#     ),
+#     -- Eventual conference: at the first later season with data where the team has at most
+#     -- one entry - that entry's conference, or null when the team is absent (defunct)
+#     resolved as (
+#       select ts.team_id, ts.season, ts.conferences,
+#              (select nx.conferences[1]
+#               from unnest(data_seasons) as d(season)
+#               left join team_season nx on nx.team_id = ts.team_id and nx.season = d.season
+#               where d.season > ts.season and coalesce(cardinality(nx.conferences), 0) <= 1
+#               order by d.season limit 1) as eventual
+#       from team_season ts
+#     )
+#     select team_id, season, conferences[1], true from resolved
+#     where cardinality(conferences) = 1 or eventual is null
+#     union all
+#     select team_id, season, c, true from resolved, unnest(conferences) as c
+#     where cardinality(conferences) > 1 and eventual is not null and c is distinct from eventual
+#     on conflict (team_id, season) do nothing;
+#     get diagnostics inserted = row_count;
+#     return inserted;
+#   end;
+#   $$;
+USE_BULK_RPC = os.getenv('IMPORT_USE_BULK_RPC') == '1'
+
+def resolve_history_in_database(all_seasons_data, team_id_map):
+    """Send every mapped team entry to resolve_conference_history(). Returns records created"""
+    raw = []
+    for season, teams in all_seasons_data.items():
+        for team in teams:
+            team_id = team_id_map.get(team.get('sourceId'))
+            if team_id:
+                raw.append({'team_id': team_id, 'season': season, 'conference_id': team.get('conferenceId')})
+    
+    response = supabase.rpc('resolve_conference_history', {
+        'raw': raw,
+        'data_seasons': sorted(all_seasons_data),
+    }).execute()
+    return response.data
+
+def build_conference_history(all_seasons_data, team_id_map, season_index):
     """Phase 3: Build conference history with duplicate resolution"""
     logger.info("Phase 3: Building conference history (working backwards)...")
     
@@ -254,7 +410,17 @@ def build_conference_history(all_seasons_data, team_id_map):
     except Exception as e:
         logger.error(f"Failed to clear history: {e}")
     
+    if USE_BULK_RPC:
+        try:
+            created = resolve_history_in_database(all_seasons_data, team_id_map)
+            logger.stat('history_records_created', created)
+            logger.info(f"Created {created} conference history records with resolve_conference_history()")
+            return
+        except Exception as e:
+            logger.warning(f"resolve_conference_history() failed, resolving in Python instead: {str(e)[:80]}")
+    
     teams_without_id = set()  # Track which source_ids don't have team_ids
+    history_rows = []  # Written in batches once every season is resolved
     
     # Process seasons backwards
     for season in range(2025, 1924, -1):
@@ -287,19 +453,13 @@ def build_conference_history(all_seasons_data, team_id_map):
                 # Simple case: one conference
                 conference_id = team_entries[0].get('conferenceId')
                 
-                try:
-                    supabase.table('team_conference_history').insert({
-                        'team_id': team_id,
-                        'season': season,
-                        'conference_id': conference_id,
-                        'existed': True
-                    }).execute()
-                    
-                    logger.stat('history_records_created')
-                    season_processed += 1
-                    
-                except Exception as e:
-                    logger.error(f"Failed to insert history for team {source_id} season {season}: {e}")
+                history_rows.append({
+                    'team_id': team_id,
+                    'season': season,
+                    'conference_id': conference_id,
+                    'existed': True
+                })
+                season_processed += 1
             
             else:
                 # Duplicate case: multiple conferences for this team
@@ -307,7 +467,7 @@ def build_conference_history(all_seasons_data, team_id_map):
                 conferences_in_season = [t.get('conferenceId') for t in team_entries]
                 
                 # Find eventual single conference
-                eventual_conf = find_eventual_conference(source_id, season, all_seasons_data)
+                eventual_conf = find_eventual_conference(source_id, season, season_index)
                 
                 if eventual_conf is None:
                     # Edge case: no single conference found in future
@@ -315,18 +475,13 @@ def build_conference_history(all_seasons_data, team_id_map):
                     conferences_in_season.sort()
                     conference_id = conferences_in_season[0]
                     
-                    try:
-                        supabase.table('team_conference_history').insert({
-                            'team_id': team_id,
-                            'season': season,
-                            'conference_id': conference_id,
-                            'existed': True
-                        }).execute()
-                        
-                        logger.stat('history_records_created')
-                        season_processed += 1
-                    except Exception as e:
-                        logger.error(f"Failed to insert history for team {source_id} season {season}: {e}")
+                    history_rows.append({
+                        'team_id': team_id,
+                        'season': season,
+                        'conference_id': conference_id,
+                        'existed': True
+                    })
+                    season_processed += 1
                 else:
                     # Store conferences DIFFERENT from eventual
                     correct_conferences = [c for c in conferences_in_season if c != eventual_conf]
@@ -338,40 +493,61 @@ def build_conference_history(all_seasons_data, team_id_map):
                     
                     # Store the correct conference(s) - should only be 1
                     for conference_id in correct_conferences:
-                        try:
-                            supabase.table('team_conference_history').insert({
-                                'team_id': team_id,
-                                'season': season,
-                                'conference_id': conference_id,
-                                'existed': True
-                            }).execute()
-                            
-                            logger.stat('history_records_created')
-                            season_processed += 1
-                        except Exception as e:
-                            logger.error(f"Failed to insert history for team {source_id} season {season}: {e}")
+                        history_rows.append({
+                            'team_id': team_id,
+                            'season': season,
+                            'conference_id': conference_id,
+                            'existed': True
+                        })
+                        season_processed += 1
         
         logger.info(f"  Season {season}: Processed {season_processed}, Skipped {season_skipped}")
     
+    inserted, failures = write_in_batches('team_conference_history', history_rows)
+    logger.stat('history_records_created', inserted)
+    for row, e in failures:
+        logger.error(f"Failed to insert history for team_id {row['team_id']} season {row['season']}: {e}")
+    
     logger.info(f"Created {logger.stats['history_records_created']} conference history records")
     logger.info(f"Resolved {logger.stats['duplicates_resolved']} duplicate entries")
     logger.info(f"Teams without team_id: {len(teams_without_id)}")
 
-def fill_gap_years(all_seasons_data, team_id_map):
+def get_existing_history_keys():
+    """Fetch the (team_id, season) of every stored history record, a page at a time"""
+    keys = set()
+    page_size = 1000  # PostgREST's default max rows per response
+    start = 0
+    while True:
+        response = supabase.table('team_conference_history').select('id, team_id, season').order('id').range(
+            start, start + page_size - 1
+        ).execute()
+        # The server may cap pages below page_size, so only an empty page means the end
+        if not response.data:
+            return keys
+        keys.update((r['team_id'], r['season']) for r in response.data)
+        start += len(response.data)
+
+def fill_gap_years(season_index, team_id_map):
     """Phase 4: Fill in gap years where teams didn't exist"""
     logger.info("Phase 4: Filling gap years...")
     
     # Reverse the team_id_map
     id_to_source = {v: k for k, v in team_id_map.items()}
     
+    # Seasons each source_id appeared in come straight from the shared index
+    _, team_seasons = season_index
+    
+    # Existing records are checked against one local set instead of a query per gap year
+    try:
+        existing_keys = get_existing_history_keys()
+    except Exception as e:
+        logger.error(f"Failed to load existing conference history: {e}")
+        return
+    
+    gap_rows = []
     for team_id, source_id in id_to_source.items():
         # Find first and last season this team appeared
-        seasons_appeared = []
-        for season in range(1925, 2026):
-            if season in all_seasons_data:
-                if any(t.get('sourceId') == source_id for t in all_seasons_data[season]):
-                    seasons_appeared.append(season)
-        
+        seasons_appeared = team_seasons.get(source_id, {}).keys()
         if not seasons_appeared:
             continue
         
@@ -379,24 +555,20 @@ def fill_gap_years(all_seasons_data, team_id_map):
         last_season = max(seasons_appeared)
         
         # Check for gaps between first and last
-        for season in range(first_season, last_season + 1):
-            if season not in seasons_appeared:
-                # Check if record already exists
-                try:
-                    existing = supabase.table('team_conference_history').select('id').eq('team_id', team_id).eq('season', season).execute()
-                    
-                    if not existing.data:
-                        # Insert gap year record
-                        supabase.table('team_conference_history').insert({
-                            'team_id': team_id,
-                            'season': season,
-                            'conference_id': None,
-                            'existed': False
-                        }).execute()
-                        
-                        logger.stat('gap_years_filled')
-                except Exception as e:
-                    logger.error(f"Failed to insert gap year for team_id {team_id} season {season}: {e}")
+        for season in sorted(set(range(first_season, last_season + 1)) - seasons_appeared):
+            # Queue a gap year record unless one already exists
+            if (team_id, season) not in existing_keys:
+                gap_rows.append({
+                    'team_id': team_id,
+                    'season': season,
+                    'conference_id': None,
+                    'existed': False
+                })
+    
+    inserted, failures = write_in_batches('team_conference_history', gap_rows)
+    logger.stat('gap_years_filled', inserted)
+    for row, e in failures:
+        logger.error(f"Failed to insert gap year for team_id {row['team_id']} season {row['season']}: {e}")
     
     logger.info(f"Filled {logger.stats['gap_years_filled']} gap years")
 
@@ -408,15 +580,25 @@ def validate_data():
     logger.info("Check 1: Duplicate (team_id, season) combinations...")
     logger.info("✓ No duplicates possible (enforced by UNIQUE constraint)")
     
-    # Check 2: Orphaned conference IDs
+    # The checks' queries are independent - run them all at once and report in order
+    queries = {
+        'all_conferences': supabase.table('conferences').select('id'),
+        'gap_records': supabase.table('team_conference_history').select('id', count='exact', head=True).eq('existed', False),
+        'team_count': supabase.table('teams').select('id', count='exact', head=True),
+        'history_count': supabase.table('team_conference_history').select('id', count='exact', head=True),
+    }
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        futures = {name: executor.submit(query.execute) for name, query in queries.items()}
+    results = {name: future.result() for name, future in futures.items()}
+    
+    # Check 2: Orphaned conference IDs - Postgres returns only history rows whose conference
+    # isn't a known one, so every row is checked without downloading the whole table
     logger.info("Check 2: Orphaned conference IDs...")
-    history_conferences = supabase.table('team_conference_history').select('conference_id').not_.is_('conference_id', 'null').execute()
-    all_conferences = supabase.table('conferences').select('id').execute()
-    
-    history_conf_ids = set(record['conference_id'] for record in history_conferences.data)
-    valid_conf_ids = set(conf['id'] for conf in all_conferences.data)
-    
-    orphaned = history_conf_ids - valid_conf_ids
+    valid_conf_ids = sorted(conf['id'] for conf in results['all_conferences'].data)
+    orphan_query = supabase.table('team_conference_history').select('conference_id').not_.is_('conference_id', 'null')
+    if valid_conf_ids:
+        orphan_query = orphan_query.not_.in_('conference_id', valid_conf_ids)
+    orphaned = set(record['conference_id'] for record in orphan_query.execute().data)
     if orphaned:
         logger.warning(f"Found {len(orphaned)} orphaned conference IDs: {orphaned}")
     else:
@@ -424,13 +606,12 @@ def validate_data():
     
     # Check 3: Gap year logic
     logger.info("Check 3: Gap year validation...")
-    gap_records = supabase.table('team_conference_history').select('*').eq('existed', False).execute()
-    logger.info(f"✓ Found {len(gap_records.data)} gap year records")
+    logger.info(f"✓ Found {results['gap_records'].count} gap year records")
     
     # Check 4: Data completeness
     logger.info("Check 4: Data completeness...")
-    team_count = supabase.table('teams').select('id', count='exact').execute()
-    history_count = supabase.table('team_conference_history').select('id', count='exact').execute()
+    team_count = results['team_count']
+    history_count = results['history_count']
     
     logger.info(f"✓ Total teams: {team_count.count}")
     logger.info(f"✓ Total history records: {history_count.count}")
@@ -456,11 +637,14 @@ def main():
         # Get team ID mapping
         team_id_map = get_team_id_map()
         
+        # Index the season data once - Phases 3 and 4 both look teams up by source_id
+        season_index = build_team_season_index(all_seasons_data)
+        
         # Phase 3: Build conference history
-        build_conference_history(all_seasons_data, team_id_map)
+        build_conference_history(all_seasons_data, team_id_map, season_index)
         
         # Phase 4: Fill gap years
-        fill_gap_years(all_seasons_data, team_id_map)
+        fill_gap_years(season_index, team_id_map)
         
         # Phase 5: Validate
         validate_data()
@@ -479,4 +663,6 @@ def main():
         raise
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
+    if db_conn:
+        db_conn.close()
\ No newline at end of file
@@ -1,22 +1,16 @@
+import csv
 import pandas as pd
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import numpy as np
 import os
-import glob
-import math
+from common import SUPABASE_URL, CSV_READ_OPTIONS, get_client, season_counts, list_csv_files, execute_with_backoff, is_transient
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-# Load environment variables
-load_dotenv()
+# Initialize Supabase client - its pooled HTTP client is shared by the file worker threads
+supabase = get_client()
 
-# Initialize Supabase client
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in .env file")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Rows per insert request - failed batches are bisected to isolate bad rows
+BATCH_SIZE = 1000
 
 print("🏀 Starting Team Season Stats Import...")
 print(f"📊 Connected to Supabase: {SUPABASE_URL}")
@@ -107,6 +101,92 @@ COLUMN_MAPPING = {
     'opponentStats_trueShooting': 'opponent_true_shooting',
 }
 
+# Text columns - everything else in the mapping is numeric
+TEXT_COLUMNS = frozenset({'team', 'conference', 'season_label'})
+
+def insert_batch(batch):
+    """Insert a batch, bisecting on failure to isolate bad rows. Returns (inserted, failures)"""
+    try:
+        execute_with_backoff(supabase.table('team_season_stats').insert(batch))
+        return len(batch), []
+    except Exception as e:
+        # Still failing after backoff, or a single bad row - record the failures
+        if is_transient(e) or len(batch) == 1:
+            return 0, [(record, e) for record in batch]
+        
+        # Retry each half - only halves that still fail are split further
+        mid = len(batch) // 2
+        left_inserted, left_failures = insert_batch(batch[:mid])
+        right_inserted, right_failures = insert_batch(batch[mid:])
+        return left_inserted + right_inserted, left_failures + right_failures
+
+def process_csv(csv_file):
+    """Read, clean and upload one year's CSV. Output is collected in result['log'] so
+    files processed concurrently still print one after another"""
+    filename = os.path.basename(csv_file)
+    year = filename.replace('.csv', '')
+    
+    result = {
+        'filename': filename,
+        'year': year,
+        'log': [],
+        'total': 0,
+        'inserted': 0,
+        'failed': 0,
+        'error': None,
+    }
+    log = result['log']
+    
+    try:
+        # Read CSV - only the mapped columns are parsed, and the parser types clean numeric
+        # columns as int64/float64 directly. With pyarrow installed its multi-threaded parser is
+        # used; it needs usecols as a list of names present in the file, so the header is read first
+        with open(csv_file, newline='', encoding='utf-8-sig') as f:
+            header = next(csv.reader(f), [])
+        df = pd.read_csv(csv_file, usecols=[col for col in header if col in COLUMN_MAPPING], **CSV_READ_OPTIONS)
+        log.append(f"   ✅ Loaded {len(df)} teams from {filename}")
+        
+        # Rename columns to snake_case
+        df = df.rename(columns=COLUMN_MAPPING)
+        
+        # Clean data types for numeric columns - only ones left as text (stray non-numeric cells)
+        # need coercing. inf is masked across all of them in one np.isfinite call, and becomes
+        # None with the NaNs below
+        numeric_cols = [col for col in df.columns if col not in TEXT_COLUMNS]
+        text_cols = [col for col in numeric_cols if not pd.api.types.is_numeric_dtype(df[col])]
+        if text_cols:
+            df[text_cols] = df[text_cols].apply(pd.to_numeric, errors='coerce')
+        numeric = df[numeric_cols]
+        df[numeric_cols] = numeric.where(np.isfinite(numeric))
+        
+        # Convert to records - the object cast turns every NaN into None in one pass, CRITICAL for Supabase
+        records = df.astype(object).where(df.notna(), None).to_dict('records')
+        result['total'] = len(records)
+        
+        # Import in batches
+        for i in range(0, len(records), BATCH_SIZE):
+            batch = records[i:i + BATCH_SIZE]
+            batch_num = (i // BATCH_SIZE) + 1
+            total_batches = (len(records) + BATCH_SIZE - 1) // BATCH_SIZE
+            
+            inserted, failures = insert_batch(batch)
+            result['inserted'] += inserted
+            result['failed'] += len(failures)
+            
+            if not failures:
+                log.append(f"   ✅ Batch {batch_num}/{total_batches}: Inserted {len(batch)} records")
+            else:
+                log.append(f"   ⚠️  Batch {batch_num} failed, retried by bisection...")
+                for record, record_error in failures:
+                    log.append(f"      ❌ Failed: {record.get('team', 'Unknown')} - {str(record_error)[:80]}")
+        
+        log.append(f"   📊 {year} Summary: {result['inserted']} inserted, {result['failed']} failed")
+        
+    except Exception as e:
+        result['error'] = str(e)
+    
+    return result
+
 # Option to clear existing data
 print("\n❓ Clear existing data in team_season_stats table first?")
 print("1. Yes - delete all existing stats")
@@ -123,7 +203,7 @@ if clear_choice == "1":
 
 # Find all CSV files in team_season_stats folder
 csv_folder = 'team_season_stats'
-csv_files = sorted(glob.glob(f'{csv_folder}/*.csv'))
+csv_files = list_csv_files(csv_folder)
 
 if not csv_files:
     print(f"\n❌ No CSV files found in {csv_folder}/ folder!")
@@ -140,83 +220,31 @@ total_inserted = 0
 failed_files = []
 file_summary = []
 
-# Process each CSV file
-for csv_file in csv_files:
-    filename = os.path.basename(csv_file)
-    year = filename.replace('.csv', '')
-    
-    print(f"\n{'='*60}")
-    print(f"📅 Processing {year}...")
-    print(f"{'='*60}")
-    
-    try:
-        # Read CSV
-        df = pd.read_csv(csv_file)
-        print(f"   ✅ Loaded {len(df)} teams from {filename}")
-        
-        # Rename columns to snake_case
-        df = df.rename(columns=COLUMN_MAPPING)
-        
-        # Clean data types for numeric columns
-        numeric_cols = [col for col in df.columns if col not in ['team', 'conference', 'season_label']]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        # Replace NaN with None - must do this AFTER numeric conversion
-        # Use fillna(None) which properly converts NaN to None
-        df = df.replace({float('nan'): None, float('inf'): None, float('-inf'): None})
-        
-        # Convert to records
-        records = df.to_dict('records')
-        
-        # Double-check: Replace any remaining NaN values in the dict
-        for record in records:
-            for key, value in record.items():
-                if value is not None and isinstance(value, float):
-                    if math.isnan(value) or math.isinf(value):
-                        record[key] = None
-        total_records += len(records)
-        
-        # Import in batches
-        batch_size = 200
-        file_inserted = 0
-        file_failed = 0
+# Process CSV files concurrently - each file's upload is bound by network latency, so
+# FILE_WORKERS files are in flight at once; results are reported in year order
+FILE_WORKERS = int(os.getenv('IMPORT_FILE_WORKERS', '4'))
+
+with ThreadPoolExecutor(max_workers=FILE_WORKERS) as executor:
+    for result in executor.map(process_csv, csv_files):
+        print(f"\n{'='*60}")
+        print(f"📅 Processing {result['year']}...")
+        print(f"{'='*60}")
+        for line in result['log']:
+            print(line)
         
-        for i in range(0, len(records), batch_size):
-            batch = records[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            total_batches = (len(records) + batch_size - 1) // batch_size
-            
-            try:
-                supabase.table('team_season_stats').insert(batch).execute()
-                file_inserted += len(batch)
-                total_inserted += len(batch)
-                print(f"   ✅ Batch {batch_num}/{total_batches}: Inserted {len(batch)} records")
-            except Exception as e:
-                print(f"   ⚠️  Batch {batch_num} failed, retrying individually...")
-                
-                for record in batch:
-                    try:
-                        supabase.table('team_season_stats').insert([record]).execute()
-                        file_inserted += 1
-                        total_inserted += 1
-                    except Exception as record_error:
-                        file_failed += 1
-                        print(f"      ❌ Failed: {record.get('team', 'Unknown')} - {str(record_error)[:80]}")
+        if result['error']:
+            print(f"   ❌ Error processing {result['filename']}: {result['error']}")
+            failed_files.append({'file': result['filename'], 'error': result['error']})
+            continue
         
+        total_records += result['total']
+        total_inserted += result['inserted']
         file_summary.append({
-            'year': year,
-            'total': len(records),
-            'inserted': file_inserted,
-            'failed': file_failed
+            'year': result['year'],
+            'total': result['total'],
+            'inserted': result['inserted'],
+            'failed': result['failed']
         })
-        
-        print(f"   📊 {year} Summary: {file_inserted} inserted, {file_failed} failed")
-        
-    except Exception as e:
-        print(f"   ❌ Error processing {filename}: {e}")
-        failed_files.append({'file': filename, 'error': str(e)})
 
 # Final Summary
 print("\n" + "="*60)
@@ -240,16 +268,15 @@ if failed_files:
 # Verify in database
 print("\n🔍 Verifying import...")
 try:
-    result = supabase.table('team_season_stats').select('season', count='exact').execute()
+    result = supabase.table('team_season_stats').select('season', count='exact', head=True).execute()
     db_count = result.count
     print(f"✅ Database now contains {db_count} team-season records")
     
-    # Show season breakdown
+    # Show season breakdown - head-only counts, fetched concurrently
     print("\n📊 Records by season:")
-    for year in range(2005, 2026):
-        count_result = supabase.table('team_season_stats').select('season', count='exact').eq('season', year).execute()
-        if count_result.count > 0:
-            print(f"   {year}: {count_result.count} teams")
+    for year, count in season_counts('team_season_stats', range(2005, 2026)):
+        if count > 0:
+            print(f"   {year}: {count} teams")
     
 except Exception as e:
     print(f"❌ Verification failed: {e}")
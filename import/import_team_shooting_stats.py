@@ -1,22 +1,11 @@
-import pandas as pd
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import csv
 import os
-import glob
+from common import SUPABASE_URL, get_client, list_csv_files
 import math
 from datetime import datetime
 
-# Load environment variables
-load_dotenv()
-
 # Initialize Supabase client
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in .env file")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase = get_client()
 
 print("🏀 Starting Team Season Shooting Stats Import...")
 print(f"📊 Connected to Supabase: {SUPABASE_URL}")
@@ -59,6 +48,70 @@ COLUMN_MAPPING = {
     'attemptsBreakdown_dunks': 'attempts_breakdown_dunks',
 }
 
+# Define integer vs decimal columns - everything but the team name is numeric
+INTEGER_COLUMNS = frozenset({
+    'season', 'team_id', 'tracked_shots',
+    'dunks_made', 'dunks_attempted', 'dunks_assisted',
+    'layups_made', 'layups_attempted', 'layups_assisted',
+    'tip_ins_made', 'tip_ins_attempted',
+    'two_point_jumpers_made', 'two_point_jumpers_attempted', 'two_point_jumpers_assisted',
+    'three_point_jumpers_made', 'three_point_jumpers_attempted', 'three_point_jumpers_assisted',
+})
+
+def to_string(value):
+    """CSV cell -> str, or None when blank"""
+    return value or None
+
+def to_decimal(value):
+    """CSV cell -> finite float, or None for blanks, text and NaN/inf - CRITICAL for Supabase"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+def to_integer(value):
+    """CSV cell -> int, rounded to handle float precision, or None"""
+    number = to_decimal(value)
+    return None if number is None else round(number)
+
+def read_records(csv_file):
+    """Read one CSV into typed insert records. Returns (rows read, records, duplicates removed)"""
+    row_count = 0
+    records = []
+    duplicates_removed = 0
+    seen_keys = set()
+    
+    with open(csv_file, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        # Resolve each header's snake_case name and converter once per file.
+        # Conference is dropped (data quality issues)
+        fields = []
+        for col in reader.fieldnames:
+            if col == 'conference':
+                continue
+            db_col = COLUMN_MAPPING.get(col, col)
+            if db_col == 'team':
+                fields.append((col, db_col, to_string))
+            elif db_col in INTEGER_COLUMNS:
+                fields.append((col, db_col, to_integer))
+            else:
+                fields.append((col, db_col, to_decimal))
+        
+        for row in reader:
+            row_count += 1
+            record = {db_col: convert(row[col]) for col, db_col, convert in fields}
+            
+            # Remove duplicates - keep first instance of each (season, team_id)
+            key = (record.get('season'), record.get('team_id'))
+            if key in seen_keys:
+                duplicates_removed += 1
+                continue
+            seen_keys.add(key)
+            records.append(record)
+    
+    return row_count, records, duplicates_removed
+
 # Option to clear existing data
 print("\n❓ Clear existing data in team_season_shooting_stats table first?")
 print("1. Yes - delete all existing stats")
@@ -74,7 +127,7 @@ if clear_choice == "1":
 
 # Find all CSV files in team_season_shooting_stats folder
 csv_folder = 'team_season_shooting_stats'
-csv_files = sorted(glob.glob(f'{csv_folder}/*.csv'))
+csv_files = list_csv_files(csv_folder)
 
 if not csv_files:
     print(f"\n❌ No CSV files found in {csv_folder}/ folder!")
@@ -101,65 +154,12 @@ for csv_file in csv_files:
     print(f"{'='*60}")
     
     try:
-        # Read CSV
-        df = pd.read_csv(csv_file, low_memory=False)
-        print(f"   ✅ Loaded {len(df)} teams from {filename}")
-        
-        # Rename columns to snake_case
-        rename_dict = {k: v for k, v in COLUMN_MAPPING.items() if k in df.columns}
-        df = df.rename(columns=rename_dict)
-        
-        # Drop conference column (data quality issues)
-        if 'conference' in df.columns:
-            df = df.drop(columns=['conference'])
-        
-        # Remove duplicates - keep first instance of each (season, team_id)
-        initial_count = len(df)
-        df = df.drop_duplicates(subset=['season', 'team_id'], keep='first')
-        duplicates_removed = initial_count - len(df)
+        # Stream the CSV straight into typed records - no DataFrame round trip
+        row_count, records, duplicates_removed = read_records(csv_file)
+        print(f"   ✅ Loaded {row_count} teams from {filename}")
         if duplicates_removed > 0:
             print(f"   🔧 Removed {duplicates_removed} duplicate rows")
         
-        # Define integer vs decimal columns
-        integer_columns = [
-            'season', 'team_id', 'tracked_shots',
-            'dunks_made', 'dunks_attempted', 'dunks_assisted',
-            'layups_made', 'layups_attempted', 'layups_assisted',
-            'tip_ins_made', 'tip_ins_attempted',
-            'two_point_jumpers_made', 'two_point_jumpers_attempted', 'two_point_jumpers_assisted',
-            'three_point_jumpers_made', 'three_point_jumpers_attempted', 'three_point_jumpers_assisted',
-        ]
-        
-        # Clean data types
-        for col in df.columns:
-            if col in ['team']:
-                continue  # Skip string columns
-            elif col in integer_columns:
-                # Integer columns - robust conversion
-                try:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                    df[col] = df[col].round(0)  # Round to handle float precision
-                    df[col] = df[col].astype('Int64')
-                except Exception as e:
-                    print(f"      Warning: Could not convert {col} to integer: {e}")
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-            else:
-                # Decimal columns (percentages)
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        # Replace NaN with None - CRITICAL for Supabase
-        df = df.replace({float('nan'): None, float('inf'): None, float('-inf'): None})
-        
-        # Convert to records
-        records = df.to_dict('records')
-        
-        # Double-check: Replace any remaining NaN values
-        for record in records:
-            for key, value in record.items():
-                if value is not None and isinstance(value, float):
-                    if math.isnan(value) or math.isinf(value):
-                        record[key] = None
-        
         total_records += len(records)
         
         # Import in batches
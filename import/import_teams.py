@@ -1,19 +1,65 @@
 import pandas as pd
-from supabase import create_client, Client
-from dotenv import load_dotenv
+from postgrest.types import ReturnMethod
+from common import (SUPABASE_URL, CONCURRENCY, CSV_READ_OPTIONS, MAX_BODY_BYTES, execute_with_backoff,
+                    get_client, is_transient, iter_batches)
+from concurrent.futures import ThreadPoolExecutor
 import os
 
-# Load environment variables
-load_dotenv()
-
-# Initialize Supabase client
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
-
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in .env file")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Initialize Supabase client - the shared one from common, which gzips upload bodies when
+# IMPORT_GZIP_BODIES=1 and encodes them with orjson
+supabase = get_client()
+
+# Optional direct Postgres connection - when set, teams are loaded with COPY instead of REST inserts
+SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL')
+db_conn = None
+if SUPABASE_DB_URL:
+    import psycopg
+    from psycopg import sql
+    db_conn = psycopg.connect(SUPABASE_DB_URL, autocommit=True)
+    print("📊 Bulk loading with COPY over a direct Postgres connection")
+
+# Rows per insert request - the whole teams.csv fits in one request at the default. Batches
+# are also closed early so each JSON body stays under the API gateway's request size limit
+BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '2000'))
+
+# Declared up front so the reader skips type inference and ids arrive as ints
+TEAMS_DTYPES = {
+    'id': 'int64',
+    'team': 'string',
+    'mascot': 'string',
+    'nickname': 'string',
+    'abbreviation': 'string',
+    'display_name': 'string',
+    'primary_color': 'string',
+    'secondary_color': 'string',
+}
+
+def copy_records(records):
+    """Bulk load records with a single COPY in one transaction"""
+    columns = list(records[0].keys())
+    query = sql.SQL("COPY teams ({}) FROM STDIN").format(
+        sql.SQL(', ').join(map(sql.Identifier, columns))
+    )
+    with db_conn.transaction(), db_conn.cursor() as cur:
+        with cur.copy(query) as copy:
+            for record in records:
+                copy.write_row(tuple(record.values()))
+
+def insert_batch(batch):
+    """Insert a batch, bisecting on failure to isolate bad rows. Returns (inserted, failures)"""
+    try:
+        execute_with_backoff(supabase.table('teams').insert(batch, returning=ReturnMethod.minimal))
+        return len(batch), []
+    except Exception as e:
+        # Still failing after backoff, or a single bad row - record the failures
+        if is_transient(e) or len(batch) == 1:
+            return 0, [(record, e) for record in batch]
+        
+        # Retry each half - only halves that still fail are split further
+        mid = len(batch) // 2
+        left_inserted, left_failures = insert_batch(batch[:mid])
+        right_inserted, right_failures = insert_batch(batch[mid:])
+        return left_inserted + right_inserted, left_failures + right_failures
 
 print("🏀 Starting Teams Import...")
 print(f"📊 Connected to Supabase: {SUPABASE_URL}")
@@ -34,7 +80,7 @@ if clear_choice == "1":
 
 # Read CSV
 print("\n📂 Reading teams.csv...")
-df = pd.read_csv('teams.csv')
+df = pd.read_csv('teams.csv', dtype=TEAMS_DTYPES, **CSV_READ_OPTIONS)
 print(f"✅ Loaded {len(df)} teams from CSV")
 
 # Data validation
@@ -43,60 +89,66 @@ print(f"   Total rows: {len(df)}")
 print(f"   Unique IDs: {df['id'].nunique()}")
 print(f"   Unique team names: {df['team'].nunique()}")
 print(f"   Null counts:")
-print(f"     - mascot: {df['mascot'].isna().sum()}")
-print(f"     - nickname: {df['nickname'].isna().sum()}")
-print(f"     - abbreviation: {df['abbreviation'].isna().sum()}")
-print(f"     - display_name: {df['display_name'].isna().sum()}")
-print(f"     - primary_color: {df['primary_color'].isna().sum()}")
-print(f"     - secondary_color: {df['secondary_color'].isna().sum()}")
-
-if df['id'].duplicated().any():
-    print("⚠️  WARNING: Duplicate IDs found!")
-    print(df[df['id'].duplicated(keep=False)][['id', 'team']])
-
-# Clean data types
-print("\n🔧 Cleaning data types...")
-df['id'] = df['id'].astype(int)
+null_counts = df[['mascot', 'nickname', 'abbreviation', 'display_name', 'primary_color', 'secondary_color']].isna().sum()
+for col, count in null_counts.items():
+    print(f"     - {col}: {count}")
 
-# Replace NaN with None (converts to NULL in database)
-df = df.where(pd.notna(df), None)
+# keep=False marks every copy of a duplicated id, so one mask serves the check and the listing
+duplicate_ids = df['id'].duplicated(keep=False)
+if duplicate_ids.any():
+    print("⚠️  WARNING: Duplicate IDs found!")
+    print(df.loc[duplicate_ids, ['id', 'team']])
 
-# Convert to list of dicts
-records = df.to_dict('records')
+# Convert to list of dicts, replacing NaN/NA with None in the same pass (NaN != NaN)
+records = [
+    {k: (None if v is pd.NA or v != v else v) for k, v in row.items()}
+    for row in df.to_dict('records')
+]
 print(f"\n📦 Prepared {len(records)} teams for import")
 
 # Import in batches
-print("\n⬆️  Uploading to Supabase...")
-batch_size = 500  # Smaller batches for safety
 total_inserted = 0
 failed_records = []
+copied = False
 
-for i in range(0, len(records), batch_size):
-    batch = records[i:i + batch_size]
-    batch_num = (i // batch_size) + 1
-    total_batches = (len(records) + batch_size - 1) // batch_size
-    
+# COPY everything in one transaction when a direct connection is available
+if db_conn and records:
+    print("\n⬆️  Copying to Postgres...")
     try:
-        result = supabase.table('teams').insert(batch).execute()
-        total_inserted += len(batch)
-        print(f"   ✅ Batch {batch_num}/{total_batches}: Inserted {len(batch)} teams")
+        copy_records(records)
+        total_inserted = len(records)
+        copied = True
+        print(f"   ✅ Copied {len(records)} teams")
     except Exception as e:
-        print(f"   ⚠️  Batch {batch_num}/{total_batches} failed, retrying individually...")
-        
-        batch_success = 0
-        for record in batch:
-            try:
-                supabase.table('teams').insert([record]).execute()
-                batch_success += 1
-                total_inserted += 1
-            except Exception as record_error:
-                failed_records.append({
-                    'team': record,
-                    'error': str(record_error)
-                })
-                print(f"      ❌ Failed: {record['team']} - {record_error}")
-        
-        print(f"      ✅ Successfully inserted {batch_success}/{len(batch)} teams")
+        print(f"   ⚠️  COPY failed, falling back to batch inserts: {str(e)[:80]}")
+
+if not copied:
+    print("\n⬆️  Uploading to Supabase...")
+    
+    # CONCURRENCY batches are in flight at once; results come back in batch order, so the
+    # counters are only touched on this thread
+    batches = list(iter_batches(records, MAX_BODY_BYTES, BATCH_SIZE))
+    total_batches = len(batches)
+    
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        for batch_num, (batch, (inserted, failures)) in enumerate(zip(batches, executor.map(insert_batch, batches)), 1):
+            total_inserted += inserted
+            
+            if not failures:
+                print(f"   ✅ Batch {batch_num}/{total_batches}: Inserted {len(batch)} teams")
+            else:
+                print(f"   ⚠️  Batch {batch_num}/{total_batches} failed, retried by bisection...")
+                for record, record_error in failures:
+                    failed_records.append({
+                        'team': record,
+                        'error': str(record_error)
+                    })
+                    print(f"      ❌ Failed: {record['team']} - {record_error}")
+                
+                print(f"      ✅ Successfully inserted {inserted}/{len(batch)} teams")
+
+if db_conn:
+    db_conn.close()
 
 # Summary
 print("\n" + "="*50)
@@ -114,12 +166,13 @@ if failed_records:
 # Verify in database
 print("\n🔍 Verifying import...")
 try:
-    result = supabase.table('teams').select('id', count='exact').execute()
+    # Head-only - the count comes back without any rows
+    result = supabase.table('teams').select('id', count='exact', head=True).execute()
     db_count = result.count
     print(f"✅ Database now contains {db_count} teams")
     
     # Show a sample
-    sample = supabase.table('teams').select('*').limit(10).execute()
+    sample = supabase.table('teams').select('id, abbreviation, team, mascot').limit(10).execute()
     print("\n📋 Sample of imported teams:")
     for team in sample.data:
         mascot = team['mascot'] or '(no mascot)'
@@ -1,35 +1,79 @@
 import os
 import requests
-from dotenv import load_dotenv
-from supabase import create_client, Client
+import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from common import SUPABASE_URL, MAX_BODY_BYTES, get_client, iter_batches, json_loads
+from postgrest.types import ReturnMethod
 from datetime import datetime, timezone
 
-# Load environment variables
-load_dotenv()
-
-# Configuration
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_KEY')
+# Configuration - common loads .env and get_client() checks the Supabase settings
 CBBD_API_BASE = os.getenv('CBBD_API_BASE', 'https://api.collegebasketballdata.com')
 CBBD_API_KEY = os.getenv('CBDB_API_KEY')
 
 # Validate environment variables
-if not all([SUPABASE_URL, SUPABASE_KEY, CBBD_API_KEY]):
-    raise ValueError("Missing required environment variables")
+if not CBBD_API_KEY:
+    raise ValueError("CBBD_API_KEY not found in environment variables")
 
 print(f"✓ Loaded SUPABASE_URL: {SUPABASE_URL}")
 print(f"✓ Loaded CBBD_API_KEY: {CBBD_API_KEY[:10]}...")
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Initialize Supabase client - the shared one from common, which gzips upload bodies when
+# IMPORT_GZIP_BODIES=1 and encodes them with orjson
+supabase = get_client()
 print("✓ Supabase client connected")
 
+# Optional direct Postgres connection - when set, venues are upserted with COPY instead of REST
+SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL')
+db_conn = None
+if SUPABASE_DB_URL:
+    import psycopg
+    from psycopg import sql
+    db_conn = psycopg.connect(SUPABASE_DB_URL, autocommit=True)
+    print("✓ Bulk loading with COPY over a direct Postgres connection")
+
+def copy_upsert_venues(records):
+    """COPY records into a temp table, then upsert them into venues in one transaction"""
+    columns = list(records[0].keys())
+    column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+    updates = sql.SQL(', ').join(
+        sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(col))
+        for col in columns if col != 'id'
+    )
+    with db_conn.transaction(), db_conn.cursor() as cur:
+        cur.execute("CREATE TEMP TABLE venues_staging (LIKE venues INCLUDING DEFAULTS) ON COMMIT DROP")
+        with cur.copy(sql.SQL("COPY venues_staging ({}) FROM STDIN").format(column_list)) as copy:
+            for record in records:
+                copy.write_row(tuple(record.values()))
+        cur.execute(sql.SQL(
+            "INSERT INTO venues ({cols}) SELECT {cols} FROM venues_staging "
+            "ON CONFLICT (id) DO UPDATE SET {updates}"
+        ).format(cols=column_list, updates=updates))
+
 # API Headers
 HEADERS = {
     'accept': 'application/json',
     'Authorization': f'Bearer {CBBD_API_KEY}'
 }
 
+# One keep-alive session for the CBBD API; gateway errors are retried with backoff
+session = requests.Session()
+session.headers.update(HEADERS)
+session.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504]),
+))
+
+# API field -> venues column
+VENUE_COLUMNS = {
+    'id': 'id',
+    'sourceId': 'source_id',
+    'name': 'name',
+    'city': 'city',
+    'state': 'state',
+    'country': 'country',
+}
+
 def import_venues():
     """Import all venues from CBBD API"""
     print(f"\n{'='*60}")
@@ -41,9 +85,9 @@ def import_venues():
     url = f"{CBBD_API_BASE}/venues"
     
     try:
-        response = requests.get(url, headers=HEADERS, timeout=30)
+        response = session.get(url, timeout=30)
         response.raise_for_status()
-        venues_data = response.json()
+        venues_data = json_loads(response.content)
         
         if not venues_data:
             print("⚠️  No venue data available")
@@ -58,34 +102,43 @@ def import_venues():
     # Process and insert venues
     print("[2/2] Inserting venues into database...")
     
-    venues_to_insert = []
-    errors = []
+    # One timestamp for the whole import instead of two clock reads per venue
+    now_iso = datetime.now(timezone.utc).isoformat()
+    
+    # Select and rename the columns in one frame; object dtype keeps the API's values as-is
+    venues = pd.DataFrame(venues_data, dtype=object).reindex(columns=list(VENUE_COLUMNS)).rename(columns=VENUE_COLUMNS)
+    # id and name are required - venues missing either are reported and skipped
+    missing_id = venues['id'].isna()
+    missing = missing_id | venues['name'].isna()
+    labels = venues.loc[missing, 'name'].fillna(venues['id']).fillna('unknown')
+    errors = [f"Venue {label}: missing {'id' if no_id else 'name'}" for label, no_id in zip(labels, missing_id[missing])]
+    venues = venues[~missing].assign(created_at=now_iso, updated_at=now_iso)
     
-    for venue in venues_data:
+    venues_to_insert = [
+        {k: (None if v is pd.NA or v != v else v) for k, v in row.items()}
+        for row in venues.to_dict('records')
+    ]
+    
+    # Upsert everything in one COPY when a direct connection is available
+    copied = False
+    if db_conn and venues_to_insert:
         try:
-            venue_record = {
-                'id': venue['id'],
-                'source_id': venue.get('sourceId'),
-                'name': venue['name'],
-                'city': venue.get('city'),
-                'state': venue.get('state'),
-                'country': venue.get('country'),
-                'created_at': datetime.now(timezone.utc).isoformat(),
-                'updated_at': datetime.now(timezone.utc).isoformat()
-            }
-            venues_to_insert.append(venue_record)
-            
+            copy_upsert_venues(venues_to_insert)
+            copied = True
+            print(f"✅ Copied {len(venues_to_insert)} venues")
         except Exception as e:
-            errors.append(f"Venue {venue.get('name', 'unknown')}: {e}")
+            print(f"⚠️  COPY failed, falling back to REST upsert: {str(e)[:80]}")
     
     # Batch insert
-    if venues_to_insert:
+    if venues_to_insert and not copied:
         try:
             # Use upsert to handle any duplicates
-            supabase.table('venues').upsert(
-                venues_to_insert,
-                on_conflict='id'
-            ).execute()
+            for batch in iter_batches(venues_to_insert, MAX_BODY_BYTES):
+                supabase.table('venues').upsert(
+                    batch,
+                    on_conflict='id',
+                    returning=ReturnMethod.minimal
+                ).execute()
             
             print(f"✅ Successfully inserted {len(venues_to_insert)} venues")
             
@@ -108,4 +161,6 @@ def import_venues():
             print(f"  ... and {len(errors) - 10} more errors")
 
 if __name__ == "__main__":
-    import_venues()
\ No newline at end of file
+    import_venues()
+    if db_conn:
+        db_conn.close()
\ No newline at end of file
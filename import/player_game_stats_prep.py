@@ -0,0 +1,160 @@
+import pandas as pd
+import numpy as np
+import os
+
+# CSV parsing and cleaning for the player game stats import. Kept free of side
+# effects (no client, no prompts) so worker processes can import it safely.
+
+# Column mapping: CSV -> Database snake_case
+# Note: Most columns are already snake_case, but some need mapping
+COLUMN_MAPPING = {
+    'game_id': 'game_id',
+    'season': 'season',
+    'season_type': 'season_type',
+    'start_date': 'start_date',
+    'team_id': 'team_id',
+    'team': 'team',
+    # conference - not loaded (data quality issues)
+    'team_seed': 'team_seed',
+    'opponent_id': 'opponent_id',
+    'opponent': 'opponent',
+    # opponent_conference - not loaded (data quality issues)
+    'opponent_seed': 'opponent_seed',
+    'neutral_site': 'neutral_site',
+    'is_home': 'is_home',
+    'conference_game': 'conference_game',
+    'game_type': 'game_type',
+    'game_minutes': 'game_minutes',
+    'game_pace': 'game_pace',
+    'name': 'name',
+    'position': 'position',
+    'athleteId': 'athlete_id',  # Note: camelCase in CSV
+    'starter': 'starter',
+    'ejected': 'ejected',
+    'minutes': 'minutes',
+    'points': 'points',
+    'assists': 'assists',
+    'turnovers': 'turnovers',
+    'fouls': 'fouls',
+    'steals': 'steals',
+    'blocks': 'blocks',
+    'rebounds_total': 'rebounds_total',
+    'rebounds_defensive': 'rebounds_defensive',
+    'rebounds_offensive': 'rebounds_offensive',
+    # Shooting stats with mixed case in CSV
+    'fieldGoals_pct': 'field_goals_pct',
+    'fieldGoals_attempted': 'field_goals_attempted',
+    'fieldGoals_made': 'field_goals_made',
+    'twoPointFieldGoals_pct': 'two_point_field_goals_pct',
+    'twoPointFieldGoals_attempted': 'two_point_field_goals_attempted',
+    'twoPointFieldGoals_made': 'two_point_field_goals_made',
+    'threePointFieldGoals_pct': 'three_point_field_goals_pct',
+    'threePointFieldGoals_attempted': 'three_point_field_goals_attempted',
+    'threePointFieldGoals_made': 'three_point_field_goals_made',
+    'freeThrows_pct': 'free_throws_pct',
+    'freeThrows_attempted': 'free_throws_attempted',
+    'freeThrows_made': 'free_throws_made',
+    # Advanced metrics
+    'usage': 'usage',
+    'offensiveRating': 'offensive_rating',
+    'defensiveRating': 'defensive_rating',
+    'netRating': 'net_rating',
+    'effectiveFieldGoalPct': 'effective_field_goal_pct',
+    'trueShootingPct': 'true_shooting_pct',
+    'gameScore': 'game_score',
+    'assistsTurnoverRatio': 'assists_turnover_ratio',
+    'freeThrowRate': 'free_throw_rate',
+    'offensiveReboundPct': 'offensive_rebound_pct',
+}
+
+# Integer vs decimal columns - integers use the narrowest nullable dtype their range allows
+INTEGER_COLUMNS = {
+    'game_id': 'Int32', 'athlete_id': 'Int32', 'team_id': 'Int32', 'opponent_id': 'Int32',
+    'season': 'Int16', 'team_seed': 'Int16', 'opponent_seed': 'Int16',
+    'game_minutes': 'Int16', 'game_pace': 'Int16', 'minutes': 'Int16',
+    'points': 'Int16', 'assists': 'Int16', 'turnovers': 'Int16', 'fouls': 'Int16',
+    'steals': 'Int16', 'blocks': 'Int16',
+    'field_goals_attempted': 'Int16', 'field_goals_made': 'Int16',
+    'two_point_field_goals_attempted': 'Int16', 'two_point_field_goals_made': 'Int16',
+    'three_point_field_goals_attempted': 'Int16', 'three_point_field_goals_made': 'Int16',
+    'free_throws_attempted': 'Int16', 'free_throws_made': 'Int16',
+    'rebounds_total': 'Int16', 'rebounds_defensive': 'Int16', 'rebounds_offensive': 'Int16',
+}
+
+BOOLEAN_COLUMNS = ['neutral_site', 'is_home', 'conference_game', 'starter', 'ejected']
+
+STRING_COLUMNS = {'name', 'team', 'opponent', 'season_type', 'game_type', 'position', 'start_date'}
+
+# CSVs are streamed in chunks. Workers hand back each year as cleaned, typed DataFrame
+# chunks - compact to pickle - and the uploader builds insert records one chunk at a time
+CSV_CHUNK_ROWS = int(os.getenv('IMPORT_CSV_CHUNK_ROWS', '50000'))
+
+def clean_chunk(df):
+    """Rename columns and clean data types for a chunk of CSV rows"""
+    # Rename columns to snake_case
+    rename_dict = {k: v for k, v in COLUMN_MAPPING.items() if k in df.columns}
+    df = df.rename(columns=rename_dict)
+    
+    # Clean data types - one vectorized conversion per type family
+    int_cols = [col for col in df.columns if col in INTEGER_COLUMNS]
+    bool_cols = [col for col in df.columns if col in BOOLEAN_COLUMNS]
+    decimal_cols = [col for col in df.columns
+                    if col not in STRING_COLUMNS and col not in INTEGER_COLUMNS and col not in BOOLEAN_COLUMNS]
+    
+    # Boolean columns
+    df[bool_cols] = df[bool_cols].fillna(False).astype(bool)
+    
+    # Integer columns - round to handle float precision, drop inf so the integer cast can't fail.
+    # The nullable cast refuses fractional floats, so rounding stays - as one np.rint ufunc call
+    ints = np.rint(df[int_cols].apply(pd.to_numeric, errors='coerce'))
+    df[int_cols] = ints.where(np.isfinite(ints)).astype({col: INTEGER_COLUMNS[col] for col in int_cols})
+    
+    # Decimal columns (ratings, percentages, etc.) - inf becomes NaN, then None - CRITICAL for Supabase
+    decimals = df[decimal_cols].apply(pd.to_numeric, errors='coerce')
+    df[decimal_cols] = decimals.where(np.isfinite(decimals))
+    
+    # Handle date column
+    if 'start_date' in df.columns:
+        df['start_date'] = pd.to_datetime(df['start_date'], errors='coerce').dt.strftime('%Y-%m-%d')
+    
+    return df
+
+def chunk_records(df):
+    """Build insert records for a cleaned chunk, with NaN/NA as None"""
+    # Build records column-wise - zipping object arrays avoids to_dict's per-cell lookups
+    df = df.astype(object).where(df.notna(), None)
+    columns = df.columns.tolist()
+    return [dict(zip(columns, row)) for row in zip(*(df[col].to_numpy() for col in columns))]
+
+def prep_year(csv_file):
+    """Read, clean and dedup one year's CSV into DataFrame chunks (runs in a worker process)"""
+    filename = os.path.basename(csv_file)
+    result = {
+        'year': filename.replace('.csv', ''),
+        'filename': filename,
+        'rows': 0,
+        'duplicates_removed': 0,
+        'chunks': [],
+        'error': None,
+    }
+    
+    try:
+        seen_keys = set()
+        # Only parse mapped columns - unmapped ones (and the dropped conference columns)
+        # are skipped by the CSV tokenizer instead of being cleaned and thrown away
+        for df in pd.read_csv(csv_file, usecols=lambda col: col in COLUMN_MAPPING,
+                              chunksize=CSV_CHUNK_ROWS, low_memory=False):
+            result['rows'] += len(df)
+            df = clean_chunk(df)
+            
+            # Remove duplicates - keep first instance of each (game_id, athlete_id),
+            # tracked across chunks
+            keys = pd.MultiIndex.from_frame(df[['game_id', 'athlete_id']])
+            keep = ~keys.duplicated(keep='first') & ~keys.isin(seen_keys)
+            seen_keys.update(keys[keep])
+            result['duplicates_removed'] += len(df) - int(keep.sum())
+            result['chunks'].append(df[keep])
+    except Exception as e:
+        result['error'] = str(e)
+    
+    return result
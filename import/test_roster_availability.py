@@ -1,8 +1,11 @@
 # test_roster_availability.py
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
-import time
+from concurrent.futures import ThreadPoolExecutor
+from common import RateLimiter
 
 load_dotenv()
 
@@ -14,25 +17,42 @@ HEADERS = {
     'Authorization': f'Bearer {CBBD_API_KEY}'
 }
 
-print("Testing roster data availability by season...\n")
+# Seasons are probed concurrently over one keep-alive session with retry/backoff;
+# the token bucket keeps the request rate polite in place of a fixed sleep
+PROBE_WORKERS = 8
+api_limiter = RateLimiter(5)
+
+session = requests.Session()
+session.headers.update(HEADERS)
+session.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=PROBE_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.3),
+))
 
-for season in range(2005, 2026):
+def probe(season):
+    """Fetch one season's rosters and describe what came back"""
     try:
-        response = requests.get(
+        api_limiter.acquire()
+        response = session.get(
             f"{CBBD_API_BASE}/teams/roster",
             params={'season': season},
-            headers=HEADERS
+            timeout=30
         )
         response.raise_for_status()
         data = response.json()
         
         if data and len(data) > 0:
             total_players = sum(len(team.get('players', [])) for team in data)
-            print(f"✓ {season}: {len(data)} teams, {total_players} players")
+            return f"✓ {season}: {len(data)} teams, {total_players} players"
         else:
-            print(f"✗ {season}: No data")
+            return f"✗ {season}: No data"
             
     except Exception as e:
-        print(f"✗ {season}: Error - {e}")
-    
-    time.sleep(0.2)  # Be nice to the API
\ No newline at end of file
+        return f"✗ {season}: Error - {e}"
+
+print("Testing roster data availability by season...\n")
+
+with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as executor:
+    for line in executor.map(probe, range(2005, 2026)):
+        print(line)